@@ -1,11 +1,95 @@
-from datetime import date, timedelta, datetime
+from datetime import date, datetime
 from decimal import Decimal
-from typing import List, Dict
+from typing import List, Dict, Tuple
 from simulation import SalesSimulator
-from config import VAT_RATE, TOLERANCE, CASH_CUSTOMER_NAME, MIN_QUANTITY_PER_ITEM, MAX_QUANTITY_PER_ITEM, B2B_TOLERANCE_MIN, B2B_TOLERANCE_MAX
+from config import TOLERANCE, CASH_CUSTOMER_NAME, MIN_QUANTITY_PER_ITEM, MAX_QUANTITY_PER_ITEM, B2B_TOLERANCE_MIN, B2B_TOLERANCE_MAX
+from config import UNDER_NON_SELECTIVE, UNDER_SELECTIVE, OUTSIDE_INSPECTION
 from smart_sales import SmartSalesGenerator
 from refinement import refine_with_smart_adjustments
+from money import to_cents, from_cents, price_ratio, quantity_for_amount, line_cents, ex_vat_cents
+from log_utils import get_logger, quiet_logger
+from rand_utils import randint
+from itertools import accumulate, islice
+from bisect import bisect_left, bisect_right
+import heapq
 import random
+import numpy as np
+
+
+log = get_logger(__name__)
+
+# Decimal constants used inside the generation loops (parsed once at import)
+_CENT = Decimal("0.01")
+_ZERO = Decimal("0")
+_TEN_SAR = Decimal("10.00")
+_HUNDRED_SAR = Decimal("100.00")
+_STRICT_REFINE_TOLERANCE = Decimal("5.00")
+_LOOSE_REFINE_TOLERANCE = Decimal("50.00")
+_LEGACY_MAX_INVOICE_SIZE_CENTS = 300000  # 3,000.00 SAR
+
+# Classifications allowed on TAX (B2B) and SIMPLIFIED (cash) invoices, in selection order
+_TAX_CLASSES = (UNDER_NON_SELECTIVE,)
+_SIMPLIFIED_CLASSES = (UNDER_NON_SELECTIVE, UNDER_SELECTIVE, OUTSIDE_INSPECTION)
+
+
+def _build_line_item(lot: Dict, quantity: int, line_subtotal_cents: int, line_vat_cents: int) -> Dict:
+    """
+    Build a LOT-tracked line item (PRD fields + legacy aliases) in one dict.
+    Legacy aliases reference the same objects, so they cost a slot, not a copy.
+    Amounts come in as integer cents; Decimals are only created for the
+    stored fields (the total as a Decimal sum - exact for 2-decimal values).
+    """
+    lot_price = lot['unit_price_ex_vat']
+    lot_cost = lot['unit_cost_ex_vat']
+    line_subtotal = from_cents(line_subtotal_cents)
+    line_vat = from_cents(line_vat_cents)
+
+    return {
+        # PRD-compliant fields
+        'lot_id': lot['lot_id'],
+        'customs_declaration_no': lot['customs_declaration_no'],
+        'item_description': lot['item_description'],
+        'shipment_class': lot['shipment_class'],
+        'quantity': quantity,
+        'unit_price_ex_vat': lot_price,
+        'unit_cost_ex_vat': lot_cost,  # For profitability validation
+        'line_subtotal': line_subtotal,
+        'vat_amount': line_vat,
+        'line_total': line_subtotal + line_vat,
+
+        # Legacy fields for backward compatibility
+        'item_name': lot['item_name'],
+        'customs_declaration': lot['customs_declaration'],
+        'classification': lot['classification'],
+        'unit_price': lot_price,
+        'unit_cost_actual': lot_cost
+    }
+
+
+def _float_column(values: List[Decimal]) -> np.ndarray:
+    """
+    float64 array of Decimal values, converting each distinct value once.
+    (Line prices and costs repeat per lot, so there are few distinct values.)
+    """
+    floats = {value: float(value) for value in set(values)}
+    return np.fromiter(map(floats.__getitem__, values), dtype=np.float64, count=len(values))
+
+
+def _loss_record(invoice: Dict, line_item: Dict) -> Dict:
+    """
+    Describe a line item sold below its actual cost (for validation reports).
+    """
+    unit_price = line_item['unit_price']
+    unit_cost = line_item.get('unit_cost_actual', _ZERO)
+
+    return {
+        'invoice': invoice['invoice_number'],
+        'item': line_item['item_name'],
+        'selling_price': float(unit_price),
+        'actual_cost': float(unit_cost),
+        'loss': float(unit_cost - unit_price),
+        'loss_pct': float((unit_cost - unit_price) / unit_cost * 100)
+    }
 
 
 class QuarterlyAligner:
@@ -16,7 +100,7 @@ class QuarterlyAligner:
     Now supports SMART SALES GENERATION with realistic patterns!
     """
     
-    def __init__(self, simulator: SalesSimulator, use_smart_algorithm: bool = True):
+    def __init__(self, simulator: SalesSimulator, use_smart_algorithm: bool = True, verbose: bool = True):
         """
         Initialize quarterly aligner.
         
@@ -24,9 +108,28 @@ class QuarterlyAligner:
             simulator: SalesSimulator instance
             use_smart_algorithm: If True, use smart weighted algorithms (recommended)
                                 If False, use legacy random algorithms
+            verbose: If False, this aligner and its refinement calls only log
+                     warnings (progress reports are skipped, not just hidden)
         """
         self.simulator = simulator
         self.use_smart_algorithm = use_smart_algorithm
+        self.verbose = verbose
+
+        # Per-instance logger: quiet mode must not change the module logger
+        self.log = log if verbose else quiet_logger(log)
+
+        # Batched RNG for invoice times (seeded for reproducibility)
+        self.time_rng = np.random.default_rng(42)
+
+        # Generator for lot picks and quantity variation: the smart
+        # generator's seeded one, or an unseeded one for legacy mode
+        self.rng = random.Random()
+
+        # Unprofitable lots already warned about (warn once, not per attempt)
+        self.warned_unprofitable_lots = set()
+
+        # Price-sorted profitable lots for B2B invoices (built on first use)
+        self.b2b_lots_by_price = None
         
         # Initialize smart sales generator if enabled
         if self.use_smart_algorithm:
@@ -35,7 +138,8 @@ class QuarterlyAligner:
                 holidays=simulator.holidays,
                 random_seed=42  # For reproducibility
             )
-            print(f"✨ Smart Sales Algorithm ENABLED - Using realistic weighted patterns")
+            self.rng = self.smart_generator.rng
+            self.log.info(f"✨ Smart Sales Algorithm ENABLED - Using realistic weighted patterns")
     
     def align_quarter(
         self,
@@ -57,7 +161,7 @@ class QuarterlyAligner:
         if target_total_inc_vat is not None:
             # NEW format: sales_inc_vat
             total_inc_vat = target_total_inc_vat
-            target_sales = (total_inc_vat / Decimal("1.15")).quantize(Decimal('0.01'))
+            target_sales = from_cents(ex_vat_cents(total_inc_vat))
             target_vat = total_inc_vat - target_sales
         elif target_sales is not None and target_vat is not None:
             # LEGACY format: separate sales and VAT
@@ -65,88 +169,81 @@ class QuarterlyAligner:
         else:
             raise ValueError("Must provide either target_total_inc_vat or both target_sales and target_vat")
 
-        print(f"\n{'='*60}")
-        print(f"ALIGNING {quarter_name}")
-        print(f"{'='*60}")
-        print(f"Period: {start_date} to {end_date}")
-        print(f"Target Total (inc VAT): {total_inc_vat:,.2f} SAR")
-        print(f"Target Sales (ex VAT): {target_sales:,.2f} SAR")
-        print(f"Target VAT (15%): {target_vat:,.2f} SAR")
+        self.log.info(f"\n{'='*60}")
+        self.log.info(f"ALIGNING {quarter_name}")
+        self.log.info(f"{'='*60}")
+        self.log.info(f"Period: {start_date} to {end_date}")
+        self.log.info(f"Target Total (inc VAT): {total_inc_vat:,.2f} SAR")
+        self.log.info(f"Target Sales (ex VAT): {target_sales:,.2f} SAR")
+        self.log.info(f"Target VAT (15%): {target_vat:,.2f} SAR")
         
         if allow_variance:
-            print(f"Mode: 2023 (Best Effort - Accept any total)")
+            self.log.info(f"Mode: 2023 (Best Effort - Accept any total)")
         else:
-            print(f"Mode: 2024 (Strict - Must match target)")
+            self.log.info(f"Mode: 2024 (Strict - Must match target)")
         
         # Phase 1: Generate VAT customer invoices
         vat_invoices = []
-        vat_sales = Decimal("0")
-        vat_vat = Decimal("0")
+        vat_sales = _ZERO
+        vat_vat = _ZERO
+
+        # Each customer's subtotal (ex VAT) in cents, computed once and
+        # carried through subset selection and invoice generation
+        customer_subtotals_cents = [ex_vat_cents(c['purchase_amount']) for c in vat_customers or ()]
         
         if vat_customers and not allow_variance:
-            # 2024: Sort customers and select subset to avoid overshooting
-            total_customer_sales = sum(
-                (c['purchase_amount'] / Decimal("1.15")).quantize(Decimal('0.01')) 
-                for c in vat_customers
-            )
+            # 2024: Select subset of customers to avoid overshooting
+            # Running total of customer subtotals (ex VAT) in cents
+            cumulative_cents = list(accumulate(customer_subtotals_cents))
+            total_customer_sales = from_cents(cumulative_cents[-1])
             
             if total_customer_sales > target_sales:
-                print(f"  Customer total ({total_customer_sales:,.2f}) exceeds target")
-                print(f"  Selecting subset of customers to match target...")
-                
-                # Select customers until we approach target (90% threshold)
-                selected_customers = []
-                cumulative = Decimal("0")
-                
-                for customer in vat_customers:
-                    customer_subtotal = (customer['purchase_amount'] / Decimal("1.15")).quantize(Decimal('0.01'))
-                    if cumulative + customer_subtotal <= target_sales * Decimal("0.95"):
-                        selected_customers.append(customer)
-                        cumulative += customer_subtotal
-                    else:
-                        break
+                self.log.info(f"  Customer total ({total_customer_sales:,.2f}) exceeds target")
+                self.log.info(f"  Selecting subset of customers to match target...")
                 
-                vat_customers = selected_customers
-                print(f"  Selected {len(selected_customers)} customers")
+                # Select customers until we approach target (95% threshold):
+                # the longest prefix whose running total stays under it
+                threshold_cents = to_cents(target_sales) * 95 // 100
+                selected_count = bisect_right(cumulative_cents, threshold_cents)
+                vat_customers = vat_customers[:selected_count]
+                customer_subtotals_cents = customer_subtotals_cents[:selected_count]
+                self.log.info(f"  Selected {len(vat_customers)} customers")
         
         if vat_customers:
-            print(f"\nPhase 1: Generating {len(vat_customers)} B2B customer invoices...")
+            self.log.info(f"\nPhase 1: Generating {len(vat_customers)} B2B customer invoices...")
 
             # Calculate expected B2B totals from customer file
-            expected_b2b_sales = sum(
-                (c['purchase_amount'] / Decimal("1.15")).quantize(Decimal('0.01'))
-                for c in vat_customers
-            )
+            expected_b2b_sales = from_cents(sum(customer_subtotals_cents))
 
-            vat_invoices = self._generate_vat_customer_invoices(vat_customers)
-
-            # Use ACTUAL B2B totals (not expected)
-            vat_sales = sum(inv['subtotal'] for inv in vat_invoices)
-            vat_vat = sum(inv['vat_amount'] for inv in vat_invoices)
+            # Use ACTUAL B2B totals (not expected), accumulated during generation
+            vat_invoices, vat_sales, vat_vat = self._generate_vat_customer_invoices(
+                vat_customers,
+                customer_subtotals_cents
+            )
 
-            b2b_match_pct = (vat_sales / expected_b2b_sales * 100) if expected_b2b_sales > 0 else Decimal("0")
+            b2b_match_pct = (vat_sales / expected_b2b_sales * 100) if expected_b2b_sales > 0 else _ZERO
 
-            print(f"\n  Phase 1 Complete:")
-            print(f"    B2B invoices generated: {len(vat_invoices)}")
-            print(f"    Expected from customers: {expected_b2b_sales:,.2f} SAR")
-            print(f"    Actual B2B sales: {vat_sales:,.2f} SAR ({b2b_match_pct:.1f}%)")
-            print(f"    B2B VAT: {vat_vat:,.2f} SAR")
+            self.log.info(f"\n  Phase 1 Complete:")
+            self.log.info(f"    B2B invoices generated: {len(vat_invoices)}")
+            self.log.info(f"    Expected from customers: {expected_b2b_sales:,.2f} SAR")
+            self.log.info(f"    Actual B2B sales: {vat_sales:,.2f} SAR ({b2b_match_pct:.1f}%)")
+            self.log.info(f"    B2B VAT: {vat_vat:,.2f} SAR")
         else:
-            print(f"\nPhase 1: No VAT customers for this quarter")
+            self.log.info(f"\nPhase 1: No VAT customers for this quarter")
 
         # Phase 2: Calculate remaining gap using ACTUAL B2B totals
         remaining_sales = target_sales - vat_sales  # Uses actual, not expected!
         remaining_vat = target_vat - vat_vat
 
-        print(f"\nPhase 2: Calculating B2C target (Quarterly Target - Actual B2B):")
-        print(f"  Quarterly target: {target_sales:,.2f} SAR")
-        print(f"  Actual B2B: {vat_sales:,.2f} SAR")
-        print(f"  B2C needed: {remaining_sales:,.2f} SAR")
-        print(f"  B2C VAT needed: {remaining_vat:,.2f} SAR")
+        self.log.info(f"\nPhase 2: Calculating B2C target (Quarterly Target - Actual B2B):")
+        self.log.info(f"  Quarterly target: {target_sales:,.2f} SAR")
+        self.log.info(f"  Actual B2B: {vat_sales:,.2f} SAR")
+        self.log.info(f"  B2C needed: {remaining_sales:,.2f} SAR")
+        self.log.info(f"  B2C VAT needed: {remaining_vat:,.2f} SAR")
         
         # Phase 3: Generate cash sales
-        print(f"\nPhase 3: Generating cash sales...")
-        cash_invoices = self._generate_controlled_cash_sales(
+        self.log.info(f"\nPhase 3: Generating cash sales...")
+        cash_invoices, cash_sales, cash_vat = self._generate_controlled_cash_sales(
             start_date,
             end_date,
             remaining_sales,
@@ -154,76 +251,84 @@ class QuarterlyAligner:
             allow_variance=allow_variance  # Pass through
         )
         
-        print(f"  Generated: {len(cash_invoices)} cash invoices")
+        self.log.info(f"  Generated: {len(cash_invoices)} cash invoices")
         
-        # Combine
-        all_invoices = vat_invoices + cash_invoices
-
-        # Calculate actuals
-        actual_b2b_sales = sum(inv['subtotal'] for inv in vat_invoices)
-        actual_b2b_vat = sum(inv['vat_amount'] for inv in vat_invoices)
-        actual_b2c_sales = sum(inv['subtotal'] for inv in cash_invoices)
-        actual_b2c_vat = sum(inv['vat_amount'] for inv in cash_invoices)
+        # Combine in place (the phase lists are not used separately again)
+        b2b_count = len(vat_invoices)
+        all_invoices = vat_invoices
+        all_invoices.extend(cash_invoices)
+
+        # Calculate actuals (totals already accumulated by each phase)
+        actual_b2b_sales = vat_sales
+        actual_b2b_vat = vat_vat
+        actual_b2c_sales = cash_sales
+        actual_b2c_vat = cash_vat
         actual_sales = actual_b2b_sales + actual_b2c_sales
         actual_vat = actual_b2b_vat + actual_b2c_vat
 
-        sales_diff = abs(actual_sales - target_sales)
-        vat_diff = abs(actual_vat - target_vat)
+        sales_diff_cents = abs(to_cents(actual_sales) - to_cents(target_sales))
+        vat_diff_cents = abs(to_cents(actual_vat) - to_cents(target_vat))
+        sales_diff = from_cents(sales_diff_cents)
+        vat_diff = from_cents(vat_diff_cents)
 
-        print(f"\n{'='*60}")
-        print(f"ALIGNMENT COMPLETE - {quarter_name}")
-        print(f"{'='*60}")
+        # 2024: Check tolerance (5.00 SAR) - a miss is reported even when quiet
+        tolerance_cents = 500
+        target_missed = not allow_variance and (
+            sales_diff_cents >= tolerance_cents or vat_diff_cents >= tolerance_cents
+        )
 
-        print(f"\n📊 BREAKDOWN:")
-        print(f"  B2B Invoices: {len(vat_invoices)}")
-        print(f"    Sales: {actual_b2b_sales:,.2f} SAR")
-        print(f"    VAT: {actual_b2b_vat:,.2f} SAR")
-        if vat_customers:
-            expected_b2b = sum((c['purchase_amount'] / Decimal("1.15")).quantize(Decimal('0.01')) for c in vat_customers)
-            b2b_pct = (actual_b2b_sales / expected_b2b * 100) if expected_b2b > 0 else Decimal("0")
-            print(f"    Match: {b2b_pct:.1f}% of customer expectations")
-
-        print(f"\n  B2C Invoices: {len(cash_invoices)}")
-        print(f"    Sales: {actual_b2c_sales:,.2f} SAR")
-        print(f"    VAT: {actual_b2c_vat:,.2f} SAR")
-
-        print(f"\n🎯 QUARTERLY TARGET:")
-        print(f"  Target Sales (ex VAT): {target_sales:,.2f} SAR")
-        print(f"  Actual Sales (ex VAT): {actual_sales:,.2f} SAR")
-        print(f"  Difference: {sales_diff:.2f} SAR")
-        print(f"\n  Target VAT (15%): {target_vat:,.2f} SAR")
-        print(f"  Actual VAT: {actual_vat:,.2f} SAR")
-        print(f"  Difference: {vat_diff:.2f} SAR")
-        
-        # Tolerance check
-        if allow_variance:
-            # 2023: Any result is acceptable
-            coverage_pct = (actual_sales / target_sales * 100) if target_sales > 0 else 0
-            print(f"\n✅ 2023 RESULT ACCEPTED")
-            print(f"  Sales coverage: {coverage_pct:.1f}% of target")
-            print(f"  Note: 2023 uses best effort - exact matching not required")
-        else:
-            # 2024: Check tolerance
-            tolerance = Decimal("5.00")
-            
-            if sales_diff < tolerance and vat_diff < tolerance:
-                print(f"\n✅ EXCELLENT MATCH - Targets achieved with authentic pricing")
-                print(f"  Sales difference: {sales_diff:.2f} SAR")
-                print(f"  VAT difference: {vat_diff:.2f} SAR")
-            else:
-                print(f"\n⚠️ TARGET VARIANCE - Authentic pricing maintained, some variance exists")
-                print(f"  Sales difference: {sales_diff:.2f} SAR")
-                print(f"  VAT difference: {vat_diff:.2f} SAR")
-                print(f"  Note: This is acceptable - NEVER selling below cost takes priority")
+        # Informational summary (skipped, not just hidden, when quiet)
+        if self.verbose:
+            self.log.info(f"\n{'='*60}")
+            self.log.info(f"ALIGNMENT COMPLETE - {quarter_name}")
+            self.log.info(f"{'='*60}")
+
+            self.log.info(f"\n📊 BREAKDOWN:")
+            self.log.info(f"  B2B Invoices: {b2b_count}")
+            self.log.info(f"    Sales: {actual_b2b_sales:,.2f} SAR")
+            self.log.info(f"    VAT: {actual_b2b_vat:,.2f} SAR")
+            if vat_customers:
+                # Same customer list as Phase 1, so reuse its expected total
+                b2b_pct = (actual_b2b_sales / expected_b2b_sales * 100) if expected_b2b_sales > 0 else _ZERO
+                self.log.info(f"    Match: {b2b_pct:.1f}% of customer expectations")
+
+            self.log.info(f"\n  B2C Invoices: {len(cash_invoices)}")
+            self.log.info(f"    Sales: {actual_b2c_sales:,.2f} SAR")
+            self.log.info(f"    VAT: {actual_b2c_vat:,.2f} SAR")
+
+            self.log.info(f"\n🎯 QUARTERLY TARGET:")
+            self.log.info(f"  Target Sales (ex VAT): {target_sales:,.2f} SAR")
+            self.log.info(f"  Actual Sales (ex VAT): {actual_sales:,.2f} SAR")
+            self.log.info(f"  Difference: {sales_diff:.2f} SAR")
+            self.log.info(f"\n  Target VAT (15%): {target_vat:,.2f} SAR")
+            self.log.info(f"  Actual VAT: {actual_vat:,.2f} SAR")
+            self.log.info(f"  Difference: {vat_diff:.2f} SAR")
+
+            if allow_variance:
+                # 2023: Any result is acceptable
+                coverage_pct = (actual_sales / target_sales * 100) if target_sales > 0 else 0
+                self.log.info(f"\n✅ 2023 RESULT ACCEPTED")
+                self.log.info(f"  Sales coverage: {coverage_pct:.1f}% of target")
+                self.log.info(f"  Note: 2023 uses best effort - exact matching not required")
+            elif not target_missed:
+                self.log.info(f"\n✅ EXCELLENT MATCH - Targets achieved with authentic pricing")
+                self.log.info(f"  Sales difference: {sales_diff:.2f} SAR")
+                self.log.info(f"  VAT difference: {vat_diff:.2f} SAR")
+
+        if target_missed:
+            self.log.warning(f"\n⚠️ TARGET VARIANCE - Authentic pricing maintained, some variance exists")
+            self.log.warning(f"  Sales difference: {sales_diff:.2f} SAR")
+            self.log.warning(f"  VAT difference: {vat_diff:.2f} SAR")
+            self.log.warning(f"  Note: This is acceptable - NEVER selling below cost takes priority")
         
         return all_invoices
 
     def _reverse_engineer_line_items(
         self,
-        target_subtotal: Decimal,
+        target_subtotal_cents: int,
         invoice_date: date,
         customer_name: str
-    ) -> List[Dict]:
+    ) -> Tuple[List[Dict], int, int]:
         """
         REVERSE-ENGINEERING: Generate line items that sum to EXACT target amount.
 
@@ -236,146 +341,135 @@ class QuarterlyAligner:
         1. Get ALL products from inventory (no date filtering for B2B pre-orders)
         2. Greedy two-pass: bulk items first, then fine-tune
         3. Adjust last item quantity to hit exact target
-        """
 
-        # Get ALL lots from inventory for B2B (pre-arrival ordering allowed)
-        # No current_date filter - B2B can order products before they arrive
-        all_products = self.simulator.inventory.products
+        Args:
+            target_subtotal_cents: Customer's target subtotal (ex VAT) in cents
+            invoice_date: Invoice date
+            customer_name: Customer name
+
+        Returns:
+            Tuple of (line items, subtotal in cents, VAT in cents); the totals
+            are accumulated while the lines are built
+        """
 
-        # Filter only profitable lots (price >= cost)
-        available_lots = [
-            p for p in all_products
-            if p['unit_price_ex_vat'] >= p['unit_cost_ex_vat'] and p['quantity_remaining'] > 0
-        ]
+        # Profitable lots sorted by price (cheapest first for better coverage).
+        # Price, cost and the imported quantity_remaining never change, so the
+        # list is built once and shared by every B2B invoice.
+        available_lots = self.b2b_lots_by_price
+        if available_lots is None:
+            # Get ALL lots from inventory for B2B (pre-arrival ordering allowed)
+            # No current_date filter - B2B can order products before they arrive
+            available_lots = [
+                p for p in self.simulator.inventory.products
+                if p['unit_price_ex_vat'] >= p['unit_cost_ex_vat'] and p['quantity_remaining'] > 0
+            ]
+            available_lots.sort(key=lambda x: x['unit_price_ex_vat'])
+            self.b2b_lots_by_price = available_lots
 
         if not available_lots:
-            return []
+            return [], 0, 0
 
         # Step 1: Greedy algorithm - keep adding items until we approach target
         line_items = []
-        remaining = target_subtotal
+        remaining_cents = target_subtotal_cents
+        total_vat_cents = 0  # Running sum of line VAT
         used_lot_ids = set()
 
-        # Sort lots by price (cheapest first for better coverage)
-        available_lots.sort(key=lambda x: x['unit_price_ex_vat'])
+        # Lots are all profitable and sorted by price, so at a fixed remaining
+        # amount ideal_qty only falls along the list: once a lot cannot be
+        # used, no later lot can either until remaining changes. Pass 1 thus
+        # uses a prefix of the list, one line per lot, and Pass 2 carries on
+        # from the first lot it did not use. (Lot ids are not unique in the
+        # source data, so Pass 2 still skips ids that are already on the
+        # invoice.)
 
         # Pass 1: Add items with max quantity (100) to quickly approach target
         for lot in available_lots:
-            if remaining <= Decimal("50.00"):  # Switch to fine-tuning mode
+            if remaining_cents <= 5000:  # Switch to fine-tuning mode (50 SAR)
                 break
 
             lot_price = lot['unit_price_ex_vat']
-            lot_cost = lot['unit_cost_ex_vat']
-
-            # Skip if unprofitable
-            if lot_price < lot_cost:
-                continue
 
             # Calculate quantity needed
-            ideal_qty = int(remaining / lot_price)
+            ideal_qty = quantity_for_amount(remaining_cents, lot_price)
 
-            if ideal_qty >= 3:  # Only add if we need at least 3 units
-                quantity = min(100, ideal_qty)
-                line_subtotal = (lot_price * quantity).quantize(Decimal('0.01'))
-                line_vat = (line_subtotal * VAT_RATE).quantize(Decimal('0.01'))
-
-                line_items.append({
-                    'lot_id': lot['lot_id'],
-                    'customs_declaration_no': lot['customs_declaration_no'],
-                    'item_description': lot['item_description'],
-                    'shipment_class': lot['shipment_class'],
-                    'quantity': quantity,
-                    'unit_price_ex_vat': lot_price,
-                    'unit_cost_ex_vat': lot_cost,
-                    'line_subtotal': line_subtotal,
-                    'vat_amount': line_vat,
-                    'line_total': line_subtotal + line_vat,
-                    'item_name': lot['item_name'],
-                    'customs_declaration': lot['customs_declaration'],
-                    'classification': lot['classification'],
-                    'unit_price': lot_price,
-                    'unit_cost_actual': lot_cost
-                })
-
-                remaining -= line_subtotal
-                used_lot_ids.add(lot['lot_id'])
+            if ideal_qty < 3:  # Only add if we need at least 3 units
+                break
+
+            quantity = min(100, ideal_qty)
+            line_subtotal_cents, line_vat_cents = line_cents(lot_price, quantity)
+            line_items.append(_build_line_item(lot, quantity, line_subtotal_cents, line_vat_cents))
+
+            remaining_cents -= line_subtotal_cents
+            total_vat_cents += line_vat_cents
+            used_lot_ids.add(lot['lot_id'])
 
         # Pass 2: Fine-tune with smaller quantities to hit exact target
-        for lot in available_lots:
-            if remaining <= Decimal("1.00"):
+        for lot in islice(available_lots, len(line_items), None):
+            if remaining_cents <= 100:
                 break
 
             if lot['lot_id'] in used_lot_ids:
                 continue
 
             lot_price = lot['unit_price_ex_vat']
-            lot_cost = lot['unit_cost_ex_vat']
-
-            if lot_price < lot_cost:
-                continue
 
             # Try to add this lot with appropriate quantity
-            ideal_qty = int(remaining / lot_price)
+            ideal_qty = quantity_for_amount(remaining_cents, lot_price)
+            price_num, price_den = price_ratio(lot_price)
 
             if ideal_qty >= 3:
                 quantity = min(100, ideal_qty)
-            elif ideal_qty > 0 or (lot_price * 3) <= remaining + Decimal("50.00"):
+            elif ideal_qty > 0 or 300 * price_num <= (remaining_cents + 5000) * price_den:
+                # 3 units fit within remaining + 50 SAR
                 quantity = 3
             else:
-                continue
+                break  # Pricier lots would not fit either
+
+            line_subtotal_cents, line_vat_cents = line_cents(lot_price, quantity)
+            line_items.append(_build_line_item(lot, quantity, line_subtotal_cents, line_vat_cents))
 
-            line_subtotal = (lot_price * quantity).quantize(Decimal('0.01'))
-            line_vat = (line_subtotal * VAT_RATE).quantize(Decimal('0.01'))
-
-            line_items.append({
-                'lot_id': lot['lot_id'],
-                'customs_declaration_no': lot['customs_declaration_no'],
-                'item_description': lot['item_description'],
-                'shipment_class': lot['shipment_class'],
-                'quantity': quantity,
-                'unit_price_ex_vat': lot_price,
-                'unit_cost_ex_vat': lot_cost,
-                'line_subtotal': line_subtotal,
-                'vat_amount': line_vat,
-                'line_total': line_subtotal + line_vat,
-                'item_name': lot['item_name'],
-                'customs_declaration': lot['customs_declaration'],
-                'classification': lot['classification'],
-                'unit_price': lot_price,
-                'unit_cost_actual': lot_cost
-            })
-
-            remaining -= line_subtotal
+            remaining_cents -= line_subtotal_cents
+            total_vat_cents += line_vat_cents
             used_lot_ids.add(lot['lot_id'])
 
         if not line_items:
-            return []
+            return [], 0, 0
 
         # Step 2: Fine-tune last item to hit exact target
-        actual_total = sum(item['line_subtotal'] for item in line_items)
-        difference = target_subtotal - actual_total
+        # (remaining_cents is exactly target - sum of line subtotals)
+        difference_cents = remaining_cents
 
-        if abs(difference) > Decimal("1.00") and line_items:
+        if abs(difference_cents) > 100 and line_items:
             # Adjust last item's quantity to match exactly
             last_item = line_items[-1]
             unit_price = last_item['unit_price_ex_vat']
 
             # Calculate adjustment needed
-            qty_adjustment = int(difference / unit_price)
+            qty_adjustment = quantity_for_amount(difference_cents, unit_price)
             new_qty = last_item['quantity'] + qty_adjustment
 
             # Ensure bounds (3-100)
             new_qty = max(3, min(100, new_qty))
 
-            # Recalculate
+            # Recalculate, moving the running totals by the line's change
+            remaining_cents += to_cents(last_item['line_subtotal'])
+            total_vat_cents -= to_cents(last_item['vat_amount'])
             last_item['quantity'] = new_qty
-            last_item['line_subtotal'] = (unit_price * new_qty).quantize(Decimal('0.01'))
-            last_item['vat_amount'] = (last_item['line_subtotal'] * VAT_RATE).quantize(Decimal('0.01'))
-            last_item['line_total'] = last_item['line_subtotal'] + last_item['vat_amount']
+            line_subtotal_cents, line_vat_cents = line_cents(unit_price, new_qty)
+            last_item['line_subtotal'] = line_subtotal = from_cents(line_subtotal_cents)
+            last_item['vat_amount'] = line_vat = from_cents(line_vat_cents)
+            last_item['line_total'] = line_subtotal + line_vat
+            remaining_cents -= line_subtotal_cents
+            total_vat_cents += line_vat_cents
 
-        return line_items
+        return line_items, target_subtotal_cents - remaining_cents, total_vat_cents
 
-    def _generate_vat_customer_invoices(self, customers: List[Dict]) -> List[Dict]:
+    def _generate_vat_customer_invoices(
+        self,
+        customers: List[Dict],
+        subtotals_cents: List[int] = None
+    ) -> Tuple[List[Dict], Decimal, Decimal]:
         """
         Generate invoices for VAT customers with EXACT amounts from customers.xlsx.
 
@@ -383,67 +477,80 @@ class QuarterlyAligner:
         Instead of trying to match customer amounts (and failing due to limited catalog),
         we HARDCODE the exact invoice totals from customers.xlsx, then reverse-engineer
         line items that sum to those exact totals using quantity adjustments.
+
+        Args:
+            customers: VAT customers to invoice
+            subtotals_cents: Each customer's subtotal (ex VAT) in cents, if
+                already computed (default: derived from purchase_amount)
+
+        Returns:
+            Tuple of (invoices, total subtotal, total VAT)
         """
+        if subtotals_cents is None:
+            subtotals_cents = [ex_vat_cents(c['purchase_amount']) for c in customers]
+
         invoices = []
+        total_subtotal_cents = 0
+        total_vat_cents = 0
 
-        for customer in customers:
+        # Draw all invoice times up front (9:00-21:59)
+        hours = self.time_rng.integers(9, 22, size=len(customers)).tolist()
+        minutes = self.time_rng.integers(0, 60, size=len(customers)).tolist()
+        skipped_customers = []  # Reported once after the loop
+
+        for i, customer in enumerate(customers):
             # HARDCODED TARGET: Exact amount from customers.xlsx
-            total_with_vat = customer['purchase_amount']
-            target_subtotal = (total_with_vat / Decimal("1.15")).quantize(Decimal('0.01'))
-            target_vat = (target_subtotal * VAT_RATE).quantize(Decimal('0.01'))
-            target_total = (target_subtotal + target_vat).quantize(Decimal('0.01'))
+            target_subtotal_cents = subtotals_cents[i]
 
             # Random date and time
             purchase_date = customer['purchase_date']
-            invoice_datetime = datetime.combine(
-                purchase_date,
-                datetime.min.time().replace(
-                    hour=random.randint(9, 21),
-                    minute=random.randint(0, 59)
-                )
-            )
+            invoice_datetime = datetime(purchase_date.year, purchase_date.month, purchase_date.day, hours[i], minutes[i])
 
             # REVERSE-ENGINEER: Generate line items that sum to EXACT target
-            line_items = self._reverse_engineer_line_items(
-                target_subtotal=target_subtotal,
+            line_items, actual_subtotal_cents, actual_vat_cents = self._reverse_engineer_line_items(
+                target_subtotal_cents=target_subtotal_cents,
                 invoice_date=purchase_date,
                 customer_name=customer['customer_name']
             )
 
             if not line_items:
-                print(f"  ⚠️  {customer['customer_name']}: Could not generate invoice (no suitable products)")
+                skipped_customers.append(customer['customer_name'])
                 continue
             
-            # Calculate actuals from line items
-            actual_subtotal = sum(item['line_subtotal'] for item in line_items)
-            actual_vat = sum(item['vat_amount'] for item in line_items)
-            actual_total = (actual_subtotal + actual_vat).quantize(Decimal('0.01'))
-
-            # Calculate variance from HARDCODED target
-            variance = abs(actual_subtotal - target_subtotal)
-
-            # Log result with exact match status
-            if variance <= Decimal("1.00"):
-                status_icon = "✅"
-                status_text = "EXACT"
-            elif variance <= Decimal("10.00"):
-                status_icon = "✓"
-                status_text = "CLOSE"
-            else:
-                status_icon = "⚠️"
-                status_text = f"OFF BY {variance:.2f}"
+            # Actuals from line items, accumulated while they were built
+            actual_subtotal = from_cents(actual_subtotal_cents)
+            actual_vat = from_cents(actual_vat_cents)
+            actual_total = actual_subtotal + actual_vat
+
+            # Log result with exact match status (the status and its
+            # formatting are only worked out when INFO output is on)
+            if self.verbose:
+                # Variance from HARDCODED target (compared in cents)
+                variance_cents = abs(actual_subtotal_cents - target_subtotal_cents)
+                variance = from_cents(variance_cents)
+
+                if variance_cents <= 100:  # 1.00 SAR
+                    status_icon = "✅"
+                    status_text = "EXACT"
+                elif variance_cents <= 1000:  # 10.00 SAR
+                    status_icon = "✓"
+                    status_text = "CLOSE"
+                else:
+                    status_icon = "⚠️"
+                    status_text = f"OFF BY {variance:.2f}"
 
-            print(f"  {status_icon} {customer['customer_name']}: {actual_subtotal:,.2f} SAR [{status_text}]")
-            if variance > Decimal("1.00"):
-                print(f"      (Target: {target_subtotal:,.2f}, Variance: {variance:.2f})")
+                self.log.info(f"  {status_icon} {customer['customer_name']}: {actual_subtotal:,.2f} SAR [{status_text}]")
+                if variance_cents > 100:
+                    self.log.info(f"      (Target: {from_cents(target_subtotal_cents):,.2f}, Variance: {variance:.2f})")
             
             # Build invoice
             self.simulator.invoice_counter_tax += 1
             invoice_number = f"INV-TAX-{self.simulator.invoice_counter_tax:06d}"
 
-            # Handle both column name variations
-            tax_number = customer.get('tax_id') or customer.get('tax_number', '')
-            address = customer.get('adress') or customer.get('address', '')
+            # Handle both column name variations (read_customers fills the
+            # canonical keys, so the alternative names are only a fallback)
+            tax_number = customer.get('tax_number') or customer.get('tax_id', '')
+            address = customer.get('address') or customer.get('adress', '')
 
             invoice = {
                 'invoice_number': invoice_number,
@@ -460,27 +567,35 @@ class QuarterlyAligner:
             }
 
             invoices.append(invoice)
+            total_subtotal_cents += actual_subtotal_cents
+            total_vat_cents += actual_vat_cents
+
+        if skipped_customers:
+            self.log.warning(f"  ⚠️  Could not generate invoices for {len(skipped_customers)} customer(s) (no suitable products):")
+            self.log.warning(f"      {', '.join(skipped_customers)}")
+
+        total_actual = from_cents(total_subtotal_cents)
+        total_actual_vat = from_cents(total_vat_cents)
 
         # Summary report - REVERSE-ENGINEERED EXACT MATCHING
-        if invoices:
-            total_target = sum((c['purchase_amount'] / Decimal("1.15")).quantize(Decimal('0.01')) for c in customers)
-            total_actual = sum(inv['subtotal'] for inv in invoices)
+        if invoices and self.verbose:
+            total_target = from_cents(sum(subtotals_cents))
             total_variance = abs(total_actual - total_target)
 
-            print(f"\n  B2B Summary (REVERSE-ENGINEERED):")
-            print(f"    Customers processed: {len(invoices)}/{len(customers)}")
-            print(f"    Target total (from customers.xlsx): {total_target:,.2f} SAR")
-            print(f"    Actual total (from line items): {total_actual:,.2f} SAR")
-            print(f"    Variance: {total_variance:.2f} SAR")
+            self.log.info(f"\n  B2B Summary (REVERSE-ENGINEERED):")
+            self.log.info(f"    Customers processed: {len(invoices)}/{len(customers)}")
+            self.log.info(f"    Target total (from customers.xlsx): {total_target:,.2f} SAR")
+            self.log.info(f"    Actual total (from line items): {total_actual:,.2f} SAR")
+            self.log.info(f"    Variance: {total_variance:.2f} SAR")
 
-            if total_variance <= Decimal("10.00"):
-                print(f"    ✅ EXCELLENT - Hardcoded amounts matched within ±10 SAR!")
-            elif total_variance <= Decimal("100.00"):
-                print(f"    ✓ GOOD - Close match using reverse-engineering")
+            if total_variance <= _TEN_SAR:
+                self.log.info(f"    ✅ EXCELLENT - Hardcoded amounts matched within ±10 SAR!")
+            elif total_variance <= _HUNDRED_SAR:
+                self.log.info(f"    ✓ GOOD - Close match using reverse-engineering")
             else:
-                print(f"    ⚠️ Review needed - Check quantity adjustments")
+                self.log.info(f"    ⚠️ Review needed - Check quantity adjustments")
 
-        return invoices
+        return invoices, total_actual, total_actual_vat
     
     def _generate_controlled_cash_sales(
         self,
@@ -489,32 +604,49 @@ class QuarterlyAligner:
         target_sales: Decimal,
         target_vat: Decimal,
         allow_variance: bool = False  # NEW PARAMETER
-    ) -> List[Dict]:
+    ) -> Tuple[List[Dict], Decimal, Decimal]:
         """
         Generate cash invoices that match target using authentic prices and quantity adjustment.
         
         If allow_variance=True (2023): Generate as much as possible, accept any total.
         If allow_variance=False (2024): Match target precisely.
+
+        Returns:
+            Tuple of (invoices, total subtotal, total VAT) after refinement
         """
         
         # Calculate working days
-        working_days = []
-        current = start_date
-        while current <= end_date:
-            if self.simulator.is_working_day(current):
-                working_days.append(current)
-            current += timedelta(days=1)
+        working_days = self.simulator.get_working_days(start_date, end_date)
         
-        print(f"    Working days: {len(working_days)}")
+        self.log.info(f"    Working days: {len(working_days)}")
+
+        # Dates with stock: any working day on/after the earliest stock_date of
+        # a lot that still has quantity. The loop below only deducts via
+        # deduct_stock (qty_remaining), so this set is fixed for the quarter.
+        # Working days are in date order, so those dates are a suffix of them.
+        min_stock_date = min(
+            (p['stock_date'] for p in self.simulator.inventory.products if p['quantity_remaining'] > 0),
+            default=None
+        )
+        if min_stock_date is not None:
+            available_dates = working_days[bisect_left(working_days, min_stock_date):]
+        else:
+            available_dates = []
+
+        # Working days remaining from each date (inclusive), for invoice sizing
+        days_left_map = {d: len(working_days) - i for i, d in enumerate(working_days)}
         
         if allow_variance:
-            print(f"    2023 MODE: Generating maximum possible sales (target is guideline only)")
+            self.log.info(f"    2023 MODE: Generating maximum possible sales (target is guideline only)")
         else:
-            print(f"    2024 MODE: Matching target precisely using authentic prices")
+            self.log.info(f"    2024 MODE: Matching target precisely using authentic prices")
         
         invoices = []
-        actual_sales = Decimal("0")
-        actual_vat = Decimal("0")
+
+        # Running totals and thresholds in integer cents (no Decimal in the loop)
+        target_sales_cents = to_cents(target_sales)
+        actual_sales_cents = 0
+        actual_vat_cents = 0
         
         # For 2023: Try to generate enough invoices to approach target
         # For 2024: Generate just enough to hit target
@@ -522,37 +654,50 @@ class QuarterlyAligner:
             max_invoices = len(working_days) * 50  # More attempts for 2023 to reach target
         else:
             max_invoices = len(working_days) * 20  # Current logic for 2024
+
+        # Draw all invoice times up front (9:00-21:59)
+        hours = self.time_rng.integers(9, 22, size=max_invoices).tolist()
+        minutes = self.time_rng.integers(0, 60, size=max_invoices).tolist()
+
+        # LEGACY: draw the random invoice days (and 2023 size fractions) up front as well
+        if not self.use_smart_algorithm and available_dates:
+            legacy_day_picks = self.time_rng.integers(0, len(available_dates), size=max_invoices).tolist()
+            if allow_variance:
+                legacy_size_draws = self.time_rng.random(size=max_invoices).tolist()
+
+        # Stopping thresholds in cents, fixed for the whole loop.
+        # (x * 12 + 9) // 10 is ceil(x * 1.2) - exact for integer cents
+        stop_high_cents = (target_sales_cents * 12 + 9) // 10    # 120% of target (2023)
+        stop_low_cents = (target_sales_cents * 99 + 99) // 100   # 99% of target (2023)
+        close_enough_cents = 100000                              # 1,000 SAR left (2023)
+        strict_stop_cents = 10                                   # 0.10 SAR left (2024)
+
+        # Number invoices from a local counter; written back after the loop
+        invoice_counter = self.simulator.invoice_counter_simplified
         
         for i in range(max_invoices):
             # Check stopping conditions
-            remaining_sales = target_sales - actual_sales
-            remaining_vat = target_vat - actual_vat
+            remaining_sales_cents = target_sales_cents - actual_sales_cents
             
             if allow_variance:
                 # 2023: Aim for target, but accept 80-120% range (best effort)
-                if actual_sales >= target_sales * Decimal("1.2"):
-                    print(f"    Reached 120% of target, stopping (2023 best effort)")
+                if actual_sales_cents >= stop_high_cents:
+                    self.log.info(f"    Reached 120% of target, stopping (2023 best effort)")
                     break
                 # Also stop if we're very close to target (within 1%)
-                if actual_sales >= target_sales * Decimal("0.99") and remaining_sales <= Decimal("1000.00"):
-                    print(f"    Close enough to target (2023 best effort)")
+                if actual_sales_cents >= stop_low_cents and remaining_sales_cents <= close_enough_cents:
+                    self.log.info(f"    Close enough to target (2023 best effort)")
                     break
             else:
                 # 2024: Stop when very close to target (ultra-tight tolerance)
-                if remaining_sales <= Decimal("0.10"):
+                if remaining_sales_cents <= strict_stop_cents:
                     break
-            
+
             # Select working day (smart or random)
             # For Q3-2023, this will naturally prefer late September when stock arrives
-            available_dates = [
-                d for d in working_days 
-                if any(p['stock_date'] <= d for p in self.simulator.inventory.products 
-                       if p['quantity_remaining'] > 0)
-            ]
-            
             if not available_dates:
                 if allow_variance:
-                    print(f"    No more inventory available")
+                    self.log.info(f"    No more inventory available")
                 break
             
             # SMART: Use weighted date selection
@@ -564,15 +709,15 @@ class QuarterlyAligner:
                 )
             else:
                 # LEGACY: Random selection
-                invoice_date = random.choice(available_dates)
+                invoice_date = available_dates[legacy_day_picks[i]]
             
             # Target size for this invoice
             if self.use_smart_algorithm:
                 # SMART: Calculate realistic size using normal distribution
-                days_left = len([d for d in working_days if d >= invoice_date])
-                target_invoice_size = self.smart_generator.calculate_invoice_size(
+                days_left = days_left_map[invoice_date]
+                target_invoice_cents = self.smart_generator.calculate_invoice_size_cents(
                     invoice_date,
-                    remaining_sales,
+                    remaining_sales_cents,
                     days_left,
                     start_date,
                     end_date
@@ -581,19 +726,23 @@ class QuarterlyAligner:
                 # LEGACY: Random sizes
                 if allow_variance:
                     # 2023: More aggressive invoice sizes to reach target faster
-                    if remaining_sales > Decimal("50000"):
-                        target_invoice_size = Decimal(str(random.randint(2000, 8000)))
-                    elif remaining_sales > Decimal("10000"):
-                        target_invoice_size = Decimal(str(random.randint(1000, 5000)))
+                    if remaining_sales_cents > 5000000:  # 50,000 SAR
+                        size_low, size_high = 2000, 8000
+                    elif remaining_sales_cents > 1000000:  # 10,000 SAR
+                        size_low, size_high = 1000, 5000
                     else:
-                        target_invoice_size = Decimal(str(random.randint(500, 2000)))
+                        size_low, size_high = 500, 2000
+                    # Whole SAR in [size_low, size_high] from the pre-drawn fraction
+                    target_invoice_cents = 100 * (
+                        size_low + int(legacy_size_draws[i] * (size_high - size_low + 1))
+                    )
                 else:
                     # 2024: Size based on remaining target
-                    target_invoice_size = min(remaining_sales, Decimal("3000.00"))
+                    target_invoice_cents = min(remaining_sales_cents, _LEGACY_MAX_INVOICE_SIZE_CENTS)
             
             # Create invoice using authentic prices ONLY
-            line_items = self._create_authentic_price_line_items(
-                target_invoice_size,
+            line_items, invoice_subtotal_cents, invoice_vat_cents = self._create_authentic_price_line_items(
+                target_invoice_cents,
                 invoice_date,
                 invoice_type="SIMPLIFIED"
             )
@@ -601,21 +750,15 @@ class QuarterlyAligner:
             if not line_items:
                 continue
             
-            # Calculate actual totals from line items
-            invoice_subtotal = sum(item['line_subtotal'] for item in line_items)
-            invoice_vat = sum(item['vat_amount'] for item in line_items)
+            # Actual totals, accumulated while the line items were built
+            invoice_subtotal = from_cents(invoice_subtotal_cents)
+            invoice_vat = from_cents(invoice_vat_cents)
             
             # Build invoice
-            invoice_datetime = datetime.combine(
-                invoice_date,
-                datetime.min.time().replace(
-                    hour=random.randint(9, 21),
-                    minute=random.randint(0, 59)
-                )
-            )
+            invoice_datetime = datetime(invoice_date.year, invoice_date.month, invoice_date.day, hours[i], minutes[i])
             
-            self.simulator.invoice_counter_simplified += 1
-            invoice_number = f"INV-SIMP-{self.simulator.invoice_counter_simplified:06d}"
+            invoice_counter += 1
+            invoice_number = f"INV-SIMP-{invoice_counter:06d}"
             
             invoice = {
                 'invoice_number': invoice_number,
@@ -627,112 +770,115 @@ class QuarterlyAligner:
                 'line_items': line_items,
                 'subtotal': invoice_subtotal,
                 'vat_amount': invoice_vat,
-                'total': (invoice_subtotal + invoice_vat).quantize(Decimal('0.01')),
+                'total': invoice_subtotal + invoice_vat,
                 'qr_code_data': f"INV:{invoice_number}|{CASH_CUSTOMER_NAME}"
             }
             
             invoices.append(invoice)
-            actual_sales += invoice_subtotal
-            actual_vat += invoice_vat
+            actual_sales_cents += invoice_subtotal_cents
+            actual_vat_cents += invoice_vat_cents
+
+        self.simulator.invoice_counter_simplified = invoice_counter
         
-        print(f"    Generated: {len(invoices)} invoices")
-        print(f"    Actual sales: {actual_sales:,.2f} SAR (Target: {target_sales:,.2f})")
-        print(f"    Actual VAT: {actual_vat:,.2f} SAR (Target: {target_vat:,.2f})")
+        self.log.info(f"    Generated: {len(invoices)} invoices")
+        self.log.info(f"    Actual sales: {from_cents(actual_sales_cents):,.2f} SAR (Target: {target_sales:,.2f})")
+        self.log.info(f"    Actual VAT: {from_cents(actual_vat_cents):,.2f} SAR (Target: {target_vat:,.2f})")
         
         if allow_variance:
-            coverage_pct = (actual_sales / target_sales * 100) if target_sales > 0 else 0
-            print(f"    Coverage: {coverage_pct:.1f}% of target")
+            coverage_pct = (actual_sales_cents * 100 / target_sales_cents) if target_sales_cents > 0 else 0
+            self.log.info(f"    Coverage: {coverage_pct:.1f}% of target")
         
         # ITERATIVE REFINEMENT: Fine-tune to match target precisely
         # Only for 2024 (strict mode) or if smart algorithm is enabled
         if not allow_variance or self.use_smart_algorithm:
-            target_total_inc_vat = (target_sales + target_vat).quantize(Decimal('0.01'))
+            target_total_inc_vat = (target_sales + target_vat).quantize(_CENT)
             invoices = refine_with_smart_adjustments(
                 invoices,
                 target_total_inc_vat,
-                tolerance=Decimal("5.00") if not allow_variance else Decimal("50.00")
+                tolerance=_STRICT_REFINE_TOLERANCE if not allow_variance else _LOOSE_REFINE_TOLERANCE,
+                current_total=from_cents(actual_sales_cents + actual_vat_cents),
+                verbose=self.verbose
             )
+
+            # Refinement adjusts quantities in place - re-total in a single pass
+            actual_sales_cents = 0
+            actual_vat_cents = 0
+            for inv in invoices:
+                actual_sales_cents += to_cents(inv['subtotal'])
+                actual_vat_cents += to_cents(inv['vat_amount'])
         
-        return invoices
+        return invoices, from_cents(actual_sales_cents), from_cents(actual_vat_cents)
     
     def _create_authentic_price_line_items(
         self,
-        target_subtotal: Decimal,
+        target_subtotal_cents: int,
         invoice_date: date,
         invoice_type: str,
         deduct_stock: bool = True,  # Whether to actually deduct from inventory
         tolerance_min: Decimal = Decimal("1.00"),  # Minimum acceptable percentage (1.00 = 100%)
         tolerance_max: Decimal = Decimal("1.00")   # Maximum acceptable percentage (1.00 = 100%)
-    ) -> List[Dict]:
+    ) -> Tuple[List[Dict], int, int]:
         """
         Create line items using LOT-BASED inventory with authentic lot prices.
         CRITICAL: Each line item tracks its lot_id for PRD compliance.
         If same item from multiple lots, creates SEPARATE line items.
-        """
 
-        # Get available LOTS by classification (not aggregated items)
-        from config import UNDER_NON_SELECTIVE, UNDER_SELECTIVE, OUTSIDE_INSPECTION
+        Args:
+            target_subtotal_cents: Target invoice subtotal in cents
 
-        if invoice_type == "TAX":
-            available_lots = self.simulator.inventory.get_available_lots_by_classification(
-                UNDER_NON_SELECTIVE,
-                current_date=invoice_date
-            )
-        else:
-            available_lots = (
-                self.simulator.inventory.get_available_lots_by_classification(
-                    UNDER_NON_SELECTIVE,
-                    current_date=invoice_date
-                ) +
-                self.simulator.inventory.get_available_lots_by_classification(
-                    UNDER_SELECTIVE,
-                    current_date=invoice_date
-                ) +
-                self.simulator.inventory.get_available_lots_by_classification(
-                    OUTSIDE_INSPECTION,
-                    current_date=invoice_date
-                )
-            )
+        Returns:
+            Tuple of (line items, subtotal in cents, VAT in cents); the totals
+            are accumulated while the lines are built
+        """
+
+        # Get available LOTS by classification (not aggregated items).
+        # The cached list is shared, not copied - it is only read below.
+        available_lots = self.simulator.inventory.get_available_lots_view(
+            _TAX_CLASSES if invoice_type == "TAX" else _SIMPLIFIED_CLASSES,
+            current_date=invoice_date
+        )
 
         if not available_lots:
-            return []
+            return [], 0, 0
 
         # Build line items approaching target - ONE LINE PER LOT
         line_items = []
-        remaining_target = target_subtotal
+        remaining_target_cents = target_subtotal_cents
         max_attempts = 50
-        used_lot_ids = set()  # Track used lots to avoid duplicates
-
-        # Calculate acceptable range based on tolerance
-        min_acceptable = target_subtotal * tolerance_min
-        max_acceptable = target_subtotal * tolerance_max
+        pool = available_lots  # Lots not yet on this invoice (rebuilt, never mutated, on each pick)
+
+        # Calculate acceptable range based on tolerance, as whole cents
+        # (a cents total c satisfies c >= x iff c >= ceil(x), c <= x iff c <= floor(x))
+        min_num, min_den = tolerance_min.as_integer_ratio()
+        max_num, max_den = tolerance_max.as_integer_ratio()
+        min_acceptable_cents = -(-target_subtotal_cents * min_num // min_den)
+        max_acceptable_cents = target_subtotal_cents * max_num // max_den
+        current_total_cents = 0  # Running sum of line subtotals
+        current_vat_cents = 0    # Running sum of line VAT
+
+        # Bind loop-invariant lookups once instead of per attempt
+        inventory = self.simulator.inventory
+        use_smart_algorithm = self.use_smart_algorithm
+        rng = self.rng
+        select_weighted_products = self.smart_generator.select_weighted_products if use_smart_algorithm else None
 
         for attempt in range(max_attempts):
-            # Calculate current total
-            current_total = sum(item['line_subtotal'] for item in line_items)
-
             # Stop if we've reached acceptable range
-            if current_total >= min_acceptable and current_total <= max_acceptable:
+            if min_acceptable_cents <= current_total_cents <= max_acceptable_cents:
                 break
 
             # Stop if we can't add more without exceeding max
-            if remaining_target <= Decimal("1.00") and current_total >= min_acceptable:
+            if remaining_target_cents <= 100 and current_total_cents >= min_acceptable_cents:
+                break
+
+            if not pool:
                 break
 
             # Select LOT (smart or random)
-            if self.use_smart_algorithm:
+            if use_smart_algorithm:
                 # SMART: Use weighted selection based on popularity
-                # Filter out already used lots
-                available_for_selection = [
-                    lot for lot in available_lots
-                    if lot['lot_id'] not in used_lot_ids
-                ]
-                if not available_for_selection:
-                    break
-                
-                # Select using smart weighting
-                selected_lots = self.smart_generator.select_weighted_products(
-                    available_for_selection,
+                selected_lots = select_weighted_products(
+                    pool,
                     invoice_date,
                     num_items=1
                 )
@@ -740,149 +886,137 @@ class QuarterlyAligner:
                     break
                 lot = selected_lots[0]
             else:
-                # LEGACY: Random selection
-                lot = random.choice(available_lots)
-                
-                # Skip if already used this lot
-                if lot['lot_id'] in used_lot_ids:
-                    continue
+                # LEGACY: Random selection (uniform index from one float draw;
+                # the pool shrinks as lots are used, so indices are not pre-drawn)
+                lot = pool[int(rng.random() * len(pool))]
 
-            # Get LOT-SPECIFIC price and cost
+            # Get LOT-SPECIFIC id, price and cost (read once per attempt)
+            lot_id = lot['lot_id']
             lot_price = lot['unit_price_ex_vat']
             lot_cost = lot['unit_cost_ex_vat']
 
             # CRITICAL VALIDATION: Ensure lot price is profitable
             if lot_price < lot_cost:
-                print(f"  ⚠️ Skipping lot {lot['lot_id']} - price {lot_price} below cost {lot_cost}")
+                if lot_id not in self.warned_unprofitable_lots:
+                    self.warned_unprofitable_lots.add(lot_id)
+                    self.log.warning(f"  ⚠️ Skipping lot {lot_id} - price {lot_price} below cost {lot_cost}")
                 continue
 
             # Calculate ideal quantity WITHOUT changing price
-            ideal_qty = int(remaining_target / lot_price)
+            ideal_qty = quantity_for_amount(remaining_target_cents, lot_price)
             ideal_qty = max(1, min(ideal_qty, MAX_QUANTITY_PER_ITEM))
             
             # Add ±20% random variation for realism (avoid too many identical quantities)
             if ideal_qty > 5:  # Only vary if quantity is meaningful
                 variation = int(ideal_qty * 0.2)  # 20% variation
-                ideal_qty = random.randint(
+                ideal_qty = randint(
                     max(MIN_QUANTITY_PER_ITEM, ideal_qty - variation),
-                    min(MAX_QUANTITY_PER_ITEM, ideal_qty + variation)
+                    min(MAX_QUANTITY_PER_ITEM, ideal_qty + variation),
+                    rng
                 )
 
-            # Check stock availability for this specific LOT
-            if not self.simulator.inventory.check_lot_stock_available(lot['lot_id'], ideal_qty):
-                # Try smaller quantity
-                for qty in [30, 20, 10, 5, 3, 1]:
-                    if self.simulator.inventory.check_lot_stock_available(lot['lot_id'], qty):
-                        ideal_qty = qty
-                        break
-                else:
-                    continue  # No stock available in this lot
+            # Clamp to the stock left in this specific LOT (the lot_index record
+            # is the one deduct_stock updates)
+            stock_lot = inventory.get_lot_by_id(lot_id)
+            ideal_qty = min(ideal_qty, stock_lot['qty_remaining']) if stock_lot else 0
+            if ideal_qty < 1:
+                continue  # No stock available in this lot
 
-            # Deduct from inventory using LOT-SPECIFIC deduction (if requested)
+            # Deduct from inventory using LOT-SPECIFIC deduction (if requested).
+            # The returned deduction record is not needed: one lot, one price.
             if deduct_stock:
                 try:
-                    deduction = self.simulator.inventory.deduct_stock(lot['lot_id'], ideal_qty)
+                    inventory.deduct_stock(lot_id, ideal_qty)
                 except ValueError:
                     continue
 
-            # Calculate line totals using LOT price (constant from lot record)
-            line_subtotal = (lot_price * ideal_qty).quantize(Decimal('0.01'))
-            line_vat = (line_subtotal * VAT_RATE).quantize(Decimal('0.01'))
+            # Calculate line totals using LOT price (constant from lot record),
+            # in integer cents - same rounding as Decimal quantize. This is a
+            # single price * quantity product, so there is nothing to accumulate.
+            line_subtotal_cents, line_vat_cents = line_cents(lot_price, ideal_qty)
 
             # Only add if it doesn't overshoot target too much
-            if line_subtotal <= remaining_target + Decimal("100.00"):
+            if line_subtotal_cents <= remaining_target_cents + 10000:  # 100 SAR overshoot allowance
                 # Create line item with LOT tracking (PRD-compliant)
-                line_items.append({
-                    # PRD-compliant fields
-                    'lot_id': lot['lot_id'],
-                    'customs_declaration_no': lot['customs_declaration_no'],
-                    'item_description': lot['item_description'],
-                    'shipment_class': lot['shipment_class'],
-                    'quantity': ideal_qty,
-                    'unit_price_ex_vat': lot_price,
-                    'unit_cost_ex_vat': lot_cost,  # For profitability validation
-                    'line_subtotal': line_subtotal,
-                    'vat_amount': line_vat,
-                    'line_total': line_subtotal + line_vat,
-
-                    # Legacy fields for backward compatibility
-                    'item_name': lot['item_name'],
-                    'customs_declaration': lot['customs_declaration'],
-                    'classification': lot['classification'],
-                    'unit_price': lot_price,
-                    'unit_cost_actual': lot_cost
-                })
-
-                remaining_target -= line_subtotal
-                used_lot_ids.add(lot['lot_id'])
-
-        return line_items
+                line_items.append(_build_line_item(lot, ideal_qty, line_subtotal_cents, line_vat_cents))
+
+                remaining_target_cents -= line_subtotal_cents
+                current_total_cents += line_subtotal_cents
+                current_vat_cents += line_vat_cents
+
+                # Drop the lot from the pool so it is not picked again. Several
+                # rows can share a lot_id, so drop by id (order is kept for the
+                # seeded weighted draw).
+                pool = [p for p in pool if p['lot_id'] != lot_id]
+
+        return line_items, current_total_cents, current_vat_cents
     
-    def validate_invoice_prices(self, invoices: List[Dict]) -> bool:
+    def validate_invoice_prices(self, invoices: List[Dict], sample_limit: int = 10) -> bool:
         """
         Validate that ALL invoice prices match their LOT-SPECIFIC prices and are profitable.
         Each line item's price is validated against its lot_id's actual price.
+
+        Args:
+            invoices: Invoices to validate
+            sample_limit: Number of worst loss sales to report
+
+        Returns:
+            True if no line item is sold below cost
         """
-        print(f"\n{'='*80}")
-        print("PROFITABILITY & PRICE VALIDATION - LOT-BASED")
-        print(f"{'='*80}")
+        self.log.info(f"\n{'='*80}")
+        self.log.info("PROFITABILITY & PRICE VALIDATION - LOT-BASED")
+        self.log.info(f"{'='*80}")
         
-        loss_sales = []
-        total_items = 0
-        total_revenue = Decimal("0")
-        total_cost = Decimal("0")
-        
-        for invoice in invoices:
-            for line_item in invoice['line_items']:
-                total_items += 1
-                
-                unit_price = line_item['unit_price']
-                unit_cost = line_item.get('unit_cost_actual', Decimal("0"))
-                quantity = line_item['quantity']
-                
-                # Calculate totals
-                line_revenue = unit_price * quantity
-                line_cost = unit_cost * quantity
-                
-                total_revenue += line_revenue
-                total_cost += line_cost
-                
-                # Check if selling below ACTUAL cost
-                if unit_price < unit_cost:
-                    loss_sales.append({
-                        'invoice': invoice['invoice_number'],
-                        'item': line_item['item_name'],
-                        'selling_price': float(unit_price),
-                        'actual_cost': float(unit_cost),
-                        'loss': float(unit_cost - unit_price),
-                        'loss_pct': float((unit_cost - unit_price) / unit_cost * 100)
-                    })
+        # Flatten line items into column arrays (summary figures are float anyway)
+        lines = [line_item for invoice in invoices for line_item in invoice['line_items']]
+        total_items = len(lines)
+
+        prices = _float_column([li['unit_price'] for li in lines])
+        costs = _float_column([li.get('unit_cost_actual', _ZERO) for li in lines])
+        quantities = np.fromiter((li['quantity'] for li in lines), dtype=np.float64, count=total_items)
+
+        total_revenue = float(np.dot(prices, quantities))
+        total_cost = float(np.dot(costs, quantities))
+
+        # Check if selling below ACTUAL cost. float() is monotonic, so every real
+        # loss has price <= cost here; confirm each candidate exactly in Decimal.
+        loss_indices = [
+            idx for idx in np.flatnonzero(prices <= costs).tolist()
+            if lines[idx]['unit_price'] < lines[idx].get('unit_cost_actual', _ZERO)
+        ]
+        loss_count = len(loss_indices)
         
         # Calculate profitability
         gross_profit = total_revenue - total_cost
         profit_margin = (gross_profit / total_revenue * 100) if total_revenue > 0 else 0
         
-        print(f"\n📊 Financial Summary:")
-        print(f"  Total line items: {total_items}")
-        print(f"  Total revenue: {float(total_revenue):,.2f} SAR")
-        print(f"  Total cost (FIFO actual): {float(total_cost):,.2f} SAR")
-        print(f"  Gross profit: {float(gross_profit):,.2f} SAR")
-        print(f"  Profit margin: {float(profit_margin):.2f}%")
+        self.log.info(f"\n📊 Financial Summary:")
+        self.log.info(f"  Total line items: {total_items}")
+        self.log.info(f"  Total revenue: {float(total_revenue):,.2f} SAR")
+        self.log.info(f"  Total cost (FIFO actual): {float(total_cost):,.2f} SAR")
+        self.log.info(f"  Gross profit: {float(gross_profit):,.2f} SAR")
+        self.log.info(f"  Profit margin: {float(profit_margin):.2f}%")
         
-        if len(loss_sales) == 0:
-            print(f"\n✅ PERFECT! NO LOSS SALES!")
-            print(f"All {total_items} items sold profitably using actual FIFO costs!")
+        if loss_count == 0:
+            self.log.info(f"\n✅ PERFECT! NO LOSS SALES!")
+            self.log.info(f"All {total_items} items sold profitably using actual FIFO costs!")
             return True
         else:
-            print(f"\n❌ CRITICAL: FOUND {len(loss_sales)} LOSS SALES")
+            self.log.warning(f"\n❌ CRITICAL: FOUND {loss_count} LOSS SALES")
             
-            # Show worst cases
-            loss_sales.sort(key=lambda x: x['loss_pct'], reverse=True)
-            print(f"\nWorst loss sales:")
-            for i, loss in enumerate(loss_sales[:10]):
-                print(f"  {i+1}. {loss['item']}")
-                print(f"     Sold at: {loss['selling_price']:.2f} SAR")
-                print(f"     Actual cost: {loss['actual_cost']:.2f} SAR")
-                print(f"     Loss: {loss['loss']:.2f} SAR ({loss['loss_pct']:.1f}%)")
+            # Show worst cases. Lines map back to their invoice through the
+            # running line counts (only needed on this failure path).
+            line_ends = list(accumulate(len(invoice['line_items']) for invoice in invoices))
+            loss_sales = heapq.nlargest(
+                sample_limit,
+                (_loss_record(invoices[bisect_right(line_ends, idx)], lines[idx]) for idx in loss_indices),
+                key=lambda x: x['loss_pct']
+            )
+            self.log.warning(f"\nWorst loss sales:")
+            for i, loss in enumerate(loss_sales):
+                self.log.warning(f"  {i+1}. {loss['item']}")
+                self.log.warning(f"     Sold at: {loss['selling_price']:.2f} SAR")
+                self.log.warning(f"     Actual cost: {loss['actual_cost']:.2f} SAR")
+                self.log.warning(f"     Loss: {loss['loss']:.2f} SAR ({loss['loss_pct']:.1f}%)")
             
             return False
\ No newline at end of file
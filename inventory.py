@@ -1,6 +1,8 @@
 from decimal import Decimal
-from typing import List, Dict, Tuple, Optional
+from typing import List, Dict, Tuple, Optional, Sequence
 from datetime import date
+from itertools import chain
+from collections import defaultdict
 
 
 class InventoryManager:
@@ -23,8 +25,21 @@ class InventoryManager:
         # Build lot_id index for fast lookup
         self.lot_index = {p['lot_id']: p for p in products}
 
+        # All lots of each item_description, in product order, so per-item
+        # lookups do not scan the whole product list
+        self.item_index = defaultdict(list)
+        for p in products:
+            self.item_index[p['item_description']].append(p)
+
+        # Lots per (classifications, current_date), ignoring stock level.
+        # shipment_class and stock_date never change, so only the
+        # qty_remaining check has to be redone - and only when some lot
+        # has run out or been restocked since (tracked by _stock_version).
+        self._dated_lots_cache = {}
+        self._stock_version = 0
+
         unique_lots = len(set(p['lot_id'] for p in products))
-        unique_items = len(set(p['item_description'] for p in products))
+        unique_items = len(self.item_index)
 
         print(f"Inventory initialized with {len(products)} product lots")
         print(f"  Unique lot_ids: {unique_lots}")
@@ -42,16 +57,67 @@ class InventoryManager:
         Returns:
             List of lot dictionaries (one per lot, NOT aggregated)
         """
-        available = [
-            p for p in self.products
-            if p['shipment_class'] == classification and p['qty_remaining'] > 0
-        ]
+        return self.get_available_lots_by_classifications((classification,), current_date=current_date)
 
-        # Filter by stock date if provided
-        if current_date:
-            available = [p for p in available if p['stock_date'] <= current_date]
+    def get_available_lots_by_classifications(
+        self,
+        classifications: Sequence[str],
+        current_date: date = None
+    ) -> List[Dict]:
+        """
+        Get available lots for several classifications in a single pass.
+        Lots are grouped by classification, in the order given. The
+        classification/date filter is cached per (classifications, date),
+        and the stock filter is only redone after a lot sells out or is
+        restocked.
 
-        return available
+        Args:
+            classifications: Shipment classes to include, in output order
+            current_date: Optional date filter (only lots with stock_date <= current_date)
+
+        Returns:
+            List of lot dictionaries (one per lot, NOT aggregated)
+        """
+        return list(self.get_available_lots_view(classifications, current_date))
+
+    def get_available_lots_view(self, classifications: Sequence[str], current_date: date = None) -> List[Dict]:
+        """
+        Cached in-stock lot list behind get_available_lots_by_classifications().
+
+        Returned without copying, so callers must not mutate it. A later
+        sell-out or restock replaces the cached list rather than changing it,
+        so a list already handed out stays stable.
+
+        Args:
+            classifications: Shipment classes to include, in output order
+            current_date: Optional date filter (only lots with stock_date <= current_date)
+
+        Returns:
+            Shared list of lot dictionaries
+        """
+        cache_key = (tuple(classifications), current_date)
+        entry = self._dated_lots_cache.get(cache_key)
+
+        if entry is None:
+            buckets = {classification: [] for classification in classifications}
+
+            for p in self.products:
+                bucket = buckets.get(p['shipment_class'])
+                if bucket is None:
+                    continue
+                if current_date and p['stock_date'] > current_date:
+                    continue
+                bucket.append(p)
+
+            # [candidates, stock version of in_stock, in_stock]
+            entry = [list(chain.from_iterable(buckets.values())), None, None]
+            self._dated_lots_cache[cache_key] = entry
+
+        if entry[1] != self._stock_version:
+            entry[2] = [p for p in entry[0] if p['qty_remaining'] > 0]
+            entry[1] = self._stock_version
+
+        return entry[2]
 
     def get_all_available_lots(self, current_date: date = None) -> List[Dict]:
         """
@@ -82,10 +148,7 @@ class InventoryManager:
         Returns:
             List of lots sorted by stock_date (oldest first)
         """
-        lots = [
-            p for p in self.products
-            if p['item_description'] == item_description and p['qty_remaining'] > 0
-        ]
+        lots = [p for p in self.item_index.get(item_description, ()) if p['qty_remaining'] > 0]
 
         # Sort by stock_date (FIFO - oldest first)
         lots.sort(key=lambda x: (x['stock_date'], x['import_date']))
@@ -102,11 +165,7 @@ class InventoryManager:
         Returns:
             Total quantity available across all lots
         """
-        total = sum(
-            p['qty_remaining']
-            for p in self.products
-            if p['item_description'] == item_description
-        )
+        total = sum(p['qty_remaining'] for p in self.item_index.get(item_description, ()))
         return total
 
     def get_lot_by_id(self, lot_id: str) -> Optional[Dict]:
@@ -199,6 +258,8 @@ class InventoryManager:
 
         # Deduct the quantity
         lot['qty_remaining'] -= quantity
+        if lot['qty_remaining'] <= 0:
+            self._stock_version += 1  # Lot sold out: cached in-stock lists are stale
 
         # Return deduction details
         return {
@@ -228,7 +289,10 @@ class InventoryManager:
             raise ValueError(f"Lot not found: {lot_id}")
 
         # Return the quantity
+        was_empty = lot['qty_remaining'] <= 0
         lot['qty_remaining'] += quantity
+        if was_empty:
+            self._stock_version += 1  # Lot back in stock: cached in-stock lists are stale
 
     def deduct_stock_fifo(self, item_description: str, quantity: int) -> List[Dict]:
         """
@@ -340,7 +404,6 @@ class InventoryManager:
         Returns:
             Dictionary: {classification: count_of_lots_with_stock}
         """
-        from collections import defaultdict
         counts = defaultdict(int)
 
         for p in self.products:
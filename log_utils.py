@@ -0,0 +1,69 @@
+"""
+Logging Helpers Module
+Console logging for the invoice generation pipeline.
+
+Messages are written to the current sys.stdout without any prefix, so the
+console output looks the same as plain print() calls. Any module's output
+can be silenced with logging.getLogger(<module name>).setLevel(logging.WARNING);
+quiet_logger() gives a warnings-only child for a single quiet instance or call.
+"""
+
+import logging
+import sys
+
+
+class _StdoutHandler(logging.StreamHandler):
+    """
+    StreamHandler that always writes to the current sys.stdout.
+    (Keeps print() semantics when stdout is redirected after import.)
+    """
+
+    def __init__(self):
+        super().__init__(sys.stdout)
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Get a module logger that prints bare messages to stdout at INFO level.
+
+    Args:
+        name: Logger name (normally __name__)
+
+    Returns:
+        Configured logger
+    """
+    logger = logging.getLogger(name)
+
+    if not logger.handlers:
+        handler = _StdoutHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+    return logger
+
+
+def quiet_logger(logger: logging.Logger) -> logging.Logger:
+    """
+    Child of a logger that only passes warnings (and anything the parent
+    already filters out). For quiet modes on a single instance or call,
+    without changing the parent's level for the whole process.
+
+    Args:
+        logger: Logger from get_logger()
+
+    Returns:
+        Child logger writing through the parent's handler
+    """
+    child = logger.getChild("quiet")
+    child.setLevel(max(logging.WARNING, logger.getEffectiveLevel()))
+    return child
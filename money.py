@@ -0,0 +1,133 @@
+"""
+Money Helpers Module
+Integer-cents conversions for the alignment hot loops.
+
+Invoice amounts are 2-decimal SAR values, so they round-trip exactly through
+integer cents. Decimal stays the storage type on invoice dicts; cents are only
+used for running totals and threshold comparisons.
+"""
+
+from decimal import Decimal, ROUND_HALF_UP
+from functools import lru_cache
+from typing import Tuple
+from config import VAT_RATE
+
+# VAT_RATE and 1 + VAT_RATE as exact fractions (0.15 = 3/20, 1.15 = 23/20)
+_VAT_RATE_NUM, _VAT_RATE_DEN = VAT_RATE.as_integer_ratio()
+_VAT_FACTOR_NUM, _VAT_FACTOR_DEN = (1 + VAT_RATE).as_integer_ratio()
+
+
+def _round_half_even(numerator: int, denominator: int) -> int:
+    """
+    Round numerator / denominator to an int, half-even (Decimal's default).
+
+    Args:
+        numerator: Dividend
+        denominator: Divisor (positive)
+
+    Returns:
+        Rounded quotient
+    """
+    quotient, remainder = divmod(numerator, denominator)
+    twice_remainder = 2 * remainder
+    if twice_remainder > denominator or (twice_remainder == denominator and quotient % 2):
+        quotient += 1
+    return quotient
+
+
+def to_cents(amount: Decimal) -> int:
+    """
+    Convert a SAR amount to integer cents (rounded half-up).
+
+    Args:
+        amount: Decimal amount in SAR
+
+    Returns:
+        Amount in cents as int
+    """
+    return int((amount * 100).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+def from_cents(cents: int) -> Decimal:
+    """
+    Convert integer cents back to a 2-decimal SAR amount.
+
+    Args:
+        cents: Amount in cents
+
+    Returns:
+        Decimal amount with exactly 2 decimal places
+    """
+    return Decimal(cents).scaleb(-2)
+
+
+@lru_cache(maxsize=None)
+def price_ratio(price: Decimal) -> Tuple[int, int]:
+    """
+    Exact (numerator, denominator) of a lot price.
+
+    Lot prices come from Excel with many decimal places, so they cannot be
+    stored as cents; the integer ratio keeps quantity maths exact.
+
+    Args:
+        price: Unit price (Decimal)
+
+    Returns:
+        Tuple of (numerator, denominator)
+    """
+    return price.as_integer_ratio()
+
+
+def quantity_for_amount(amount_cents: int, price: Decimal) -> int:
+    """
+    Whole units of a price that fit in an amount, i.e. int(amount / price).
+
+    Computed with integer division (truncates toward zero, like int()).
+
+    Args:
+        amount_cents: Amount in cents (may be negative)
+        price: Unit price (must be positive)
+
+    Returns:
+        Number of units
+    """
+    numerator, denominator = price_ratio(price)
+    units = abs(amount_cents) * denominator // (100 * numerator)
+    return units if amount_cents >= 0 else -units
+
+
+def line_cents(price: Decimal, quantity: int) -> Tuple[int, int]:
+    """
+    Line subtotal and VAT in cents, i.e.
+    subtotal = (price * quantity).quantize(Decimal('0.01')) and
+    vat = (subtotal * VAT_RATE).quantize(Decimal('0.01')).
+
+    Both round half-even like Decimal.quantize under the default context,
+    so the results match the Decimal version exactly.
+
+    Args:
+        price: Unit price (positive)
+        quantity: Number of units (non-negative)
+
+    Returns:
+        Tuple of (line subtotal in cents, line VAT in cents)
+    """
+    numerator, denominator = price_ratio(price)
+    subtotal_cents = _round_half_even(numerator * quantity * 100, denominator)
+    return subtotal_cents, _round_half_even(subtotal_cents * _VAT_RATE_NUM, _VAT_RATE_DEN)
+
+
+def ex_vat_cents(amount_inc_vat: Decimal) -> int:
+    """
+    Ex-VAT cents of an inc-VAT amount, i.e. (amount / 1.15).quantize(Decimal('0.01')).
+
+    Exact integer division with half-even rounding - no Decimal division.
+
+    Args:
+        amount_inc_vat: Amount including VAT
+
+    Returns:
+        Amount excluding VAT, in cents
+    """
+    numerator, denominator = amount_inc_vat.as_integer_ratio()
+    return _round_half_even(numerator * 100 * _VAT_FACTOR_DEN, denominator * _VAT_FACTOR_NUM)
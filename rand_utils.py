@@ -0,0 +1,74 @@
+"""
+Random Helpers Module
+Fast small-range integer and weighted draws for the invoice generation loops.
+
+randint() draws exactly the way random.randint does (getrandbits with
+rejection), so seeded runs produce the same numbers - it only skips randint's
+argument checks and call layers.
+
+weighted_index() does the same for a single np.random.choice(n, p=p) draw,
+using a CDF that can be built once and reused.
+
+Both use the given generator (random.Random / np.random.RandomState), or the
+module-level global one when none is passed.
+"""
+
+import random
+import numpy as np
+
+
+def randint(a: int, b: int, rng: random.Random = None) -> int:
+    """
+    Random integer N with a <= N <= b, same draw as rng.randint(a, b).
+
+    Args:
+        a: Lower bound (inclusive)
+        b: Upper bound (inclusive)
+        rng: Generator to draw from (default: the global `random` one)
+
+    Returns:
+        Random integer in [a, b]
+
+    Raises:
+        ValueError: If the range is empty (b < a)
+    """
+    n = b - a + 1
+    if n <= 0:
+        raise ValueError(f"empty range for randint({a}, {b})")
+
+    getrandbits = (rng or random).getrandbits
+    k = n.bit_length()
+    r = getrandbits(k)
+    while r >= n:  # Rejection keeps the draw unbiased
+        r = getrandbits(k)
+    return a + r
+
+
+def weighted_cdf(probabilities: np.ndarray) -> np.ndarray:
+    """
+    Normalized cumulative distribution for weighted_index().
+
+    Args:
+        probabilities: Selection probabilities (summing to ~1)
+
+    Returns:
+        CDF array, normalized so the last entry is exactly 1
+    """
+    cdf = probabilities.cumsum()
+    cdf /= cdf[-1]
+    return cdf
+
+
+def weighted_index(cdf: np.ndarray, rng: np.random.RandomState = None) -> int:
+    """
+    Random index drawn with the given CDF, same draw as
+    rng.choice(len(cdf), p=probabilities) (without its argument checks).
+
+    Args:
+        cdf: Array from weighted_cdf()
+        rng: Generator to draw from (default: NumPy's global one)
+
+    Returns:
+        Selected index
+    """
+    return int(cdf.searchsorted((rng or np.random).random_sample(), side='right'))
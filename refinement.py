@@ -6,15 +6,45 @@ Strategy: Make minimal adjustments to invoice quantities to hit exact target.
 """
 
 from decimal import Decimal
-from typing import List, Dict
+from functools import lru_cache
+from typing import List, Dict, Optional, Tuple
 from config import VAT_RATE
+from money import from_cents, line_cents
+from log_utils import get_logger, quiet_logger
+
+log = get_logger(__name__)
+
+# Decimal constants, built once instead of on every call/iteration
+_ZERO = Decimal("0")
+_VAT_FACTOR = 1 + VAT_RATE
+_MAX_PRICE_TO_VARIANCE = Decimal("1.5")  # Skip units priced above 1.5x the variance
+_DEFAULT_TOLERANCE = Decimal("5.00")
+
+
+@lru_cache(maxsize=None)
+def _price_inc_vat(unit_price_ex_vat: Decimal) -> Tuple[Decimal, float]:
+    """
+    VAT-inclusive unit price, exact and as float.
+
+    Lot prices repeat across invoices and refinement iterations, so the
+    Decimal multiply and float conversion are done once per price.
+
+    Args:
+        unit_price_ex_vat: Unit price excluding VAT
+
+    Returns:
+        Tuple of (price inc VAT, same as float)
+    """
+    unit_price_inc_vat = unit_price_ex_vat * _VAT_FACTOR
+    return unit_price_inc_vat, float(unit_price_inc_vat)
 
 
 def refine_invoices_to_target(
     invoices: List[Dict],
     target_total_inc_vat: Decimal,
-    tolerance: Decimal = Decimal("5.00"),
-    max_iterations: int = 50
+    tolerance: Decimal = _DEFAULT_TOLERANCE,
+    max_iterations: int = 50,
+    verbose: bool = True
 ) -> List[Dict]:
     """
     Iteratively refine invoices to match target by adjusting quantities.
@@ -33,65 +63,104 @@ def refine_invoices_to_target(
         target_total_inc_vat: Target total (inc VAT)
         tolerance: Acceptable variance (default: 5 SAR)
         max_iterations: Maximum adjustment iterations
+        verbose: If False, only warnings are logged
         
     Returns:
         Refined list of invoices
     """
+    logger = log if verbose else quiet_logger(log)
     
-    print(f"\n🔄 Iterative Refinement:")
+    logger.info(f"\n🔄 Iterative Refinement:")
     
     # Calculate initial state
-    initial_total = sum(inv['total'] for inv in invoices)
+    initial_total = sum((inv['total'] for inv in invoices), _ZERO)
     initial_variance = target_total_inc_vat - initial_total
     
-    print(f"   Initial total: {initial_total:,.2f} SAR")
-    print(f"   Target: {target_total_inc_vat:,.2f} SAR")
-    print(f"   Initial variance: {initial_variance:,.2f} SAR ({initial_variance/target_total_inc_vat*100:.3f}%)")
+    logger.info(f"   Initial total: {initial_total:,.2f} SAR")
+    logger.info(f"   Target: {target_total_inc_vat:,.2f} SAR")
+    logger.info(f"   Initial variance: {initial_variance:,.2f} SAR ({initial_variance/target_total_inc_vat*100:.3f}%)")
     
     if abs(initial_variance) <= tolerance:
-        print(f"   ✅ Already within tolerance!")
+        logger.info(f"   ✅ Already within tolerance!")
         return invoices
     
-    # Iterative refinement
+    # Iterative refinement (running total moved by each adjustment's change)
+    current_total = initial_total
     for iteration in range(max_iterations):
-        current_total = sum(inv['total'] for inv in invoices)
         variance = target_total_inc_vat - current_total
         
         if abs(variance) <= tolerance:
-            print(f"   ✅ Converged after {iteration} iterations")
+            logger.info(f"   ✅ Converged after {iteration} iterations")
             break
         
         # Decide: increase or decrease?
         if variance > 0:
             # Need MORE sales - increase quantity
-            success = _increase_invoice_quantity(invoices, variance)
-            if not success:
-                print(f"   ⚠️  Cannot increase further (no adjustable invoices)")
+            change = _increase_invoice_quantity(invoices, variance)
+            if change is None:
+                logger.info(f"   ⚠️  Cannot increase further (no adjustable invoices)")
                 break
         else:
             # Need LESS sales - decrease quantity
-            success = _decrease_invoice_quantity(invoices, abs(variance))
-            if not success:
-                print(f"   ⚠️  Cannot decrease further (no adjustable invoices)")
+            change = _decrease_invoice_quantity(invoices, abs(variance))
+            if change is None:
+                logger.info(f"   ⚠️  Cannot decrease further (no adjustable invoices)")
                 break
+        current_total += change
     
     # Final result
-    final_total = sum(inv['total'] for inv in invoices)
+    final_total = current_total
     final_variance = target_total_inc_vat - final_total
     improvement = abs(initial_variance) - abs(final_variance)
     
-    print(f"   Final total: {final_total:,.2f} SAR")
-    print(f"   Final variance: {final_variance:,.2f} SAR ({final_variance/target_total_inc_vat*100:.3f}%)")
-    print(f"   Improvement: {improvement:,.2f} SAR")
+    logger.info(f"   Final total: {final_total:,.2f} SAR")
+    logger.info(f"   Final variance: {final_variance:,.2f} SAR ({final_variance/target_total_inc_vat*100:.3f}%)")
+    logger.info(f"   Improvement: {improvement:,.2f} SAR")
     
     return invoices
 
 
-def _increase_invoice_quantity(invoices: List[Dict], variance: Decimal) -> bool:
+def _set_line_quantity(inv: Dict, line_idx: int, line: Dict, quantity: int) -> Decimal:
+    """
+    Change one line item's quantity and update the line and invoice totals.
+    
+    Invoice totals are adjusted by the line's change instead of re-summing
+    every line item (all amounts are 2-decimal, so the result is identical).
+    A line whose quantity drops to 0 is removed.
+    
+    Returns:
+        Change in the invoice total
+    """
+    old_subtotal = line['line_subtotal']
+    old_vat = line['vat_amount']
+    line['quantity'] = quantity
+    
+    if quantity == 0:
+        inv['line_items'].pop(line_idx)
+        new_subtotal = new_vat = _ZERO
+    else:
+        # Recalculate line totals (integer cents, same rounding as quantize)
+        line_subtotal_cents, line_vat_cents = line_cents(line['unit_price_ex_vat'], quantity)
+        new_subtotal = line['line_subtotal'] = from_cents(line_subtotal_cents)
+        new_vat = line['vat_amount'] = from_cents(line_vat_cents)
+        line['line_total'] = new_subtotal + new_vat
+    
+    # Update invoice totals by the line's change
+    inv['subtotal'] += new_subtotal - old_subtotal
+    inv['vat_amount'] += new_vat - old_vat
+    old_total = inv['total']
+    inv['total'] = inv['subtotal'] + inv['vat_amount']  # Both 2-dp, so exact
+    return inv['total'] - old_total
+
+
+def _increase_invoice_quantity(invoices: List[Dict], variance: Decimal) -> Optional[Decimal]:
     """
     Increase quantity in one invoice to add sales.
     
     Strategy: Pick invoice with largest line items (easier to add 1 unit)
+    
+    Returns:
+        Change in the invoices' total, or None if there is nothing to adjust
     """
     
     # Find invoices with items we can increase
@@ -103,19 +172,23 @@ def _increase_invoice_quantity(invoices: List[Dict], variance: Decimal) -> bool:
             candidates.append((inv, line_idx, line))
     
     if not candidates:
-        return False
+        return None
     
     # Pick the line item with price closest to variance (for efficiency)
     # But not exceeding variance by too much
     best_candidate = None
     best_diff = float('inf')
     
+    # Loop-invariant bounds, computed once rather than per candidate
+    variance_float = float(variance)
+    max_unit_price = variance * _MAX_PRICE_TO_VARIANCE
+    
     for inv, line_idx, line in candidates:
-        unit_price_inc_vat = line['unit_price_ex_vat'] * (1 + VAT_RATE)
-        diff = abs(float(variance) - float(unit_price_inc_vat))
+        unit_price_inc_vat, unit_price_inc_vat_float = _price_inc_vat(line['unit_price_ex_vat'])
+        diff = abs(variance_float - unit_price_inc_vat_float)
         
         # Prefer items that get us closer to target
-        if diff < best_diff and unit_price_inc_vat <= variance * Decimal("1.5"):
+        if diff < best_diff and unit_price_inc_vat <= max_unit_price:
             best_diff = diff
             best_candidate = (inv, line_idx, line)
     
@@ -125,26 +198,17 @@ def _increase_invoice_quantity(invoices: List[Dict], variance: Decimal) -> bool:
     
     # Increase quantity by 1
     inv, line_idx, line = best_candidate
-    line['quantity'] += 1
-    
-    # Recalculate line totals
-    line['line_subtotal'] = (line['unit_price_ex_vat'] * line['quantity']).quantize(Decimal('0.01'))
-    line['vat_amount'] = (line['line_subtotal'] * VAT_RATE).quantize(Decimal('0.01'))
-    line['line_total'] = (line['line_subtotal'] + line['vat_amount']).quantize(Decimal('0.01'))
-    
-    # Recalculate invoice totals
-    inv['subtotal'] = sum(item['line_subtotal'] for item in inv['line_items'])
-    inv['vat_amount'] = sum(item['vat_amount'] for item in inv['line_items'])
-    inv['total'] = (inv['subtotal'] + inv['vat_amount']).quantize(Decimal('0.01'))
-    
-    return True
+    return _set_line_quantity(inv, line_idx, line, line['quantity'] + 1)
 
 
-def _decrease_invoice_quantity(invoices: List[Dict], variance: Decimal) -> bool:
+def _decrease_invoice_quantity(invoices: List[Dict], variance: Decimal) -> Optional[Decimal]:
     """
     Decrease quantity in one invoice to reduce sales.
     
     Strategy: Pick invoice with items that have qty > 1
+    
+    Returns:
+        Change in the invoices' total, or None if there is nothing to adjust
     """
     
     # Find invoices with items we can decrease (qty > 1)
@@ -155,17 +219,21 @@ def _decrease_invoice_quantity(invoices: List[Dict], variance: Decimal) -> bool:
                 candidates.append((inv, line_idx, line))
     
     if not candidates:
-        return False
+        return None
     
     # Pick the line item with price closest to variance
     best_candidate = None
     best_diff = float('inf')
     
+    # Loop-invariant bounds, computed once rather than per candidate
+    variance_float = float(variance)
+    max_unit_price = variance * _MAX_PRICE_TO_VARIANCE
+    
     for inv, line_idx, line in candidates:
-        unit_price_inc_vat = line['unit_price_ex_vat'] * (1 + VAT_RATE)
-        diff = abs(float(variance) - float(unit_price_inc_vat))
+        unit_price_inc_vat, unit_price_inc_vat_float = _price_inc_vat(line['unit_price_ex_vat'])
+        diff = abs(variance_float - unit_price_inc_vat_float)
         
-        if diff < best_diff and unit_price_inc_vat <= variance * Decimal("1.5"):
+        if diff < best_diff and unit_price_inc_vat <= max_unit_price:
             best_diff = diff
             best_candidate = (inv, line_idx, line)
     
@@ -175,29 +243,15 @@ def _decrease_invoice_quantity(invoices: List[Dict], variance: Decimal) -> bool:
     
     # Decrease quantity by 1
     inv, line_idx, line = best_candidate
-    line['quantity'] -= 1
-    
-    # If quantity becomes 0, remove the line item
-    if line['quantity'] == 0:
-        inv['line_items'].pop(line_idx)
-    else:
-        # Recalculate line totals
-        line['line_subtotal'] = (line['unit_price_ex_vat'] * line['quantity']).quantize(Decimal('0.01'))
-        line['vat_amount'] = (line['line_subtotal'] * VAT_RATE).quantize(Decimal('0.01'))
-        line['line_total'] = (line['line_subtotal'] + line['vat_amount']).quantize(Decimal('0.01'))
-    
-    # Recalculate invoice totals
-    inv['subtotal'] = sum(item['line_subtotal'] for item in inv['line_items'])
-    inv['vat_amount'] = sum(item['vat_amount'] for item in inv['line_items'])
-    inv['total'] = (inv['subtotal'] + inv['vat_amount']).quantize(Decimal('0.01'))
-    
-    return True
+    return _set_line_quantity(inv, line_idx, line, line['quantity'] - 1)
 
 
 def refine_with_smart_adjustments(
     invoices: List[Dict],
     target_total_inc_vat: Decimal,
-    tolerance: Decimal = Decimal("5.00")
+    tolerance: Decimal = _DEFAULT_TOLERANCE,
+    current_total: Decimal = None,
+    verbose: bool = True
 ) -> List[Dict]:
     """
     Smart refinement that preserves realistic patterns.
@@ -207,17 +261,31 @@ def refine_with_smart_adjustments(
     - Slow days (Monday, mid-month) for decreases
     
     This maintains the realistic distribution while fine-tuning.
+
+    Args:
+        invoices: List of generated invoices
+        target_total_inc_vat: Target total (inc VAT)
+        tolerance: Acceptable variance (default: 5 SAR)
+        current_total: Sum of the invoice totals, if the caller already
+            has it (default: summed from the invoices)
+        verbose: If False, only warnings are logged
+
+    Returns:
+        Refined list of invoices
     """
+    logger = log if verbose else quiet_logger(log)
     
-    print(f"\n🔄 Smart Iterative Refinement:")
+    logger.info(f"\n🔄 Smart Iterative Refinement:")
     
-    initial_total = sum(inv['total'] for inv in invoices)
+    initial_total = current_total
+    if initial_total is None:
+        initial_total = sum((inv['total'] for inv in invoices), _ZERO)
     initial_variance = target_total_inc_vat - initial_total
     
-    print(f"   Initial variance: {initial_variance:,.2f} SAR ({initial_variance/target_total_inc_vat*100:.3f}%)")
+    logger.info(f"   Initial variance: {initial_variance:,.2f} SAR ({initial_variance/target_total_inc_vat*100:.3f}%)")
     
     if abs(initial_variance) <= tolerance:
-        print(f"   ✅ Already within tolerance!")
+        logger.info(f"   ✅ Already within tolerance!")
         return invoices
     
     # Classify invoices by day type
@@ -237,41 +305,42 @@ def refine_with_smart_adjustments(
         else:
             slow_invoices.append(inv)
     
-    print(f"   Peak day invoices: {len(peak_invoices)}")
-    print(f"   Slow day invoices: {len(slow_invoices)}")
+    logger.info(f"   Peak day invoices: {len(peak_invoices)}")
+    logger.info(f"   Slow day invoices: {len(slow_invoices)}")
     
-    # Refine strategically
+    # Refine strategically (running total moved by each adjustment's change)
     max_iterations = 50
+    current_total = initial_total
     for iteration in range(max_iterations):
-        current_total = sum(inv['total'] for inv in invoices)
         variance = target_total_inc_vat - current_total
         
         if abs(variance) <= tolerance:
-            print(f"   ✅ Converged after {iteration} iterations")
+            logger.info(f"   ✅ Converged after {iteration} iterations")
             break
         
         if variance > 0:
             # Increase on peak days (maintains realistic pattern)
             target_invoices = peak_invoices if peak_invoices else invoices
-            success = _increase_invoice_quantity(target_invoices, variance)
-            if not success:
+            change = _increase_invoice_quantity(target_invoices, variance)
+            if change is None:
                 # Fallback to any invoice
-                success = _increase_invoice_quantity(invoices, variance)
-            if not success:
+                change = _increase_invoice_quantity(invoices, variance)
+            if change is None:
                 break
         else:
             # Decrease on slow days (maintains realistic pattern)
             target_invoices = slow_invoices if slow_invoices else invoices
-            success = _decrease_invoice_quantity(target_invoices, abs(variance))
-            if not success:
+            change = _decrease_invoice_quantity(target_invoices, abs(variance))
+            if change is None:
                 # Fallback to any invoice
-                success = _decrease_invoice_quantity(invoices, abs(variance))
-            if not success:
+                change = _decrease_invoice_quantity(invoices, abs(variance))
+            if change is None:
                 break
+        current_total += change
     
-    final_total = sum(inv['total'] for inv in invoices)
+    final_total = current_total
     final_variance = target_total_inc_vat - final_total
     
-    print(f"   Final variance: {final_variance:,.2f} SAR ({final_variance/target_total_inc_vat*100:.3f}%)")
+    logger.info(f"   Final variance: {final_variance:,.2f} SAR ({final_variance/target_total_inc_vat*100:.3f}%)")
     
     return invoices
@@ -68,7 +68,18 @@ class ReportGenerator:
         Returns:
             Path to generated file
         """
-        rows = []
+        # Build the report column by column (one list per field) rather than
+        # one row dict per line item
+        invoice_numbers = []
+        invoice_dates = []
+        customs_numbers = []
+        lot_ids = []
+        item_names = []
+        unit_prices = []
+        quantities = []
+        subtotals = []
+        vat_amounts = []
+        line_totals = []
         
         for invoice in invoices:
             invoice_number = invoice['invoice_number']
@@ -76,34 +87,42 @@ class ReportGenerator:
             
             # Format date
             if isinstance(invoice_date, datetime):
-                formatted_date = invoice_date.strftime('%Y-%m-%d %H:%M:%S')
+                formatted_date = invoice_date.isoformat(' ', 'seconds')  # '%Y-%m-%d %H:%M:%S', no strftime
             else:
                 formatted_date = str(invoice_date)
             
             # Add row for each line item
             for item in invoice['line_items']:
-                row = {
-                    'رقم الفاتورة': invoice_number,
-                    'تاريخ الفاتورة': formatted_date,
-                    'رقم البيان الجمركي': item['customs_declaration_no'],  # NEW: Lot tracking
-                    'معرف اللوت': item['lot_id'],                          # NEW: Lot tracking
-                    'اسم الصنف': item['item_description'],                 # UPDATED: PRD-compliant field
-                    'سعر الوحدة (قبل الضريبة)': float(item['unit_price_ex_vat']),  # UPDATED: PRD-compliant field
-                    'الكمية': item['quantity'],
-                    'المجموع قبل الضريبة': float(item['line_subtotal']),
-                    'مبلغ الضريبة': float(item['vat_amount']),
-                    'الإجمالي شامل الضريبة': float(item['line_total'])
-                }
-                rows.append(row)
+                invoice_numbers.append(invoice_number)
+                invoice_dates.append(formatted_date)
+                customs_numbers.append(item['customs_declaration_no'])  # NEW: Lot tracking
+                lot_ids.append(item['lot_id'])                          # NEW: Lot tracking
+                item_names.append(item['item_description'])             # UPDATED: PRD-compliant field
+                unit_prices.append(float(item['unit_price_ex_vat']))    # UPDATED: PRD-compliant field
+                quantities.append(item['quantity'])
+                subtotals.append(float(item['line_subtotal']))
+                vat_amounts.append(float(item['vat_amount']))
+                line_totals.append(float(item['line_total']))
         
         # Create DataFrame
-        df = pd.DataFrame(rows)
+        df = pd.DataFrame({
+            'رقم الفاتورة': invoice_numbers,
+            'تاريخ الفاتورة': invoice_dates,
+            'رقم البيان الجمركي': customs_numbers,
+            'معرف اللوت': lot_ids,
+            'اسم الصنف': item_names,
+            'سعر الوحدة (قبل الضريبة)': unit_prices,
+            'الكمية': quantities,
+            'المجموع قبل الضريبة': subtotals,
+            'مبلغ الضريبة': vat_amounts,
+            'الإجمالي شامل الضريبة': line_totals
+        })
         
         # Save to Excel
         output_path = self._save_excel_with_error_handling(df, output_filename)
         
         print(f"✓ Detailed sales report: {output_path}")
-        print(f"  Total line items: {len(rows)}")
+        print(f"  Total line items: {len(df)}")
         
         return output_path
     
@@ -135,7 +154,7 @@ class ReportGenerator:
             # Format date
             invoice_date = invoice['invoice_date']
             if isinstance(invoice_date, datetime):
-                formatted_date = invoice_date.strftime('%Y-%m-%d %H:%M:%S')
+                formatted_date = invoice_date.isoformat(' ', 'seconds')  # '%Y-%m-%d %H:%M:%S', no strftime
             else:
                 formatted_date = str(invoice_date)
             
@@ -273,9 +292,11 @@ class ReportGenerator:
         print(f"GENERATING REPORTS FOR {quarter_name}")
         print(f"{'='*60}\n")
         
-        # Calculate actuals
-        actual_sales = sum(inv['subtotal'] for inv in invoices)
-        actual_vat = sum(inv['vat_amount'] for inv in invoices)
+        # Calculate actuals (one pass, Decimal accumulators)
+        actual_sales = actual_vat = Decimal("0")
+        for inv in invoices:
+            actual_sales += inv['subtotal']
+            actual_vat += inv['vat_amount']
         
         # Generate reports
         detailed_path = self.generate_detailed_sales_report(
@@ -2,9 +2,14 @@ from datetime import datetime, timedelta, date
 from decimal import Decimal
 from typing import List, Dict, Tuple, Optional
 import random
+import numpy as np
 from hijri_converter import Gregorian
 from config import *
 from inventory import InventoryManager
+from rand_utils import randint
+
+_CENT = Decimal("0.01")
+_ZERO = Decimal("0")
 
 
 class SalesSimulator:
@@ -15,8 +20,16 @@ class SalesSimulator:
     def __init__(self, inventory: InventoryManager, holidays: List[date]):
         self.inventory = inventory
         self.holidays = holidays
+        self._holiday_set = frozenset(holidays)  # O(1) membership for is_working_day()
         self.invoice_counter_simplified = 0
         self.invoice_counter_tax = 0
+        
+        # Working-day ordinals for the whole simulated period (all quarters),
+        # computed once and sliced per quarter by get_working_days()
+        self._working_start = min(q['period_start'] for q in QUARTERLY_TARGETS.values())
+        self._working_end = max(q['period_end'] for q in QUARTERLY_TARGETS.values())
+        self._working_ordinals = self._compute_working_ordinals(self._working_start, self._working_end)
+        self._working_dates = [date.fromordinal(o) for o in self._working_ordinals.tolist()]
     
     def is_working_day(self, check_date: date) -> bool:
         """
@@ -33,11 +46,51 @@ class SalesSimulator:
             return False
         
         # Check if in holidays list
-        if check_date in self.holidays:
+        if check_date in self._holiday_set:
             return False
         
         return True
     
+    def _compute_working_ordinals(self, start_date: date, end_date: date) -> np.ndarray:
+        """
+        Ordinals of all working days in a date range (inclusive).
+        Same rule as is_working_day(), evaluated for the whole range at once.
+        
+        Args:
+            start_date: First date of the range
+            end_date: Last date of the range
+            
+        Returns:
+            Sorted array of date ordinals
+        """
+        ordinals = np.arange(start_date.toordinal(), end_date.toordinal() + 1, dtype=np.int64)
+        holiday_ordinals = np.fromiter((h.toordinal() for h in self._holiday_set), dtype=np.int64)
+        
+        # Ordinal 1 is Monday 0001-01-01, so (ordinal - 1) % 7 == weekday(); Friday is 4
+        working_mask = ((ordinals - 1) % 7 != 4) & ~np.isin(ordinals, holiday_ordinals)
+        
+        return ordinals[working_mask]
+    
+    def get_working_days(self, start_date: date, end_date: date) -> List[date]:
+        """
+        Get all working days in a date range (inclusive).
+        
+        Args:
+            start_date: First date of the range
+            end_date: Last date of the range
+            
+        Returns:
+            List of working dates in ascending order
+        """
+        if self._working_start <= start_date and end_date <= self._working_end:
+            # Slice the precomputed working days instead of rebuilding the mask
+            lo = np.searchsorted(self._working_ordinals, start_date.toordinal(), side='left')
+            hi = np.searchsorted(self._working_ordinals, end_date.toordinal(), side='right')
+            return self._working_dates[lo:hi]
+        
+        ordinals = self._compute_working_ordinals(start_date, end_date)
+        return [date.fromordinal(o) for o in ordinals.tolist()]
+    
     def calculate_boost_factor(self, check_date: date) -> float:
         """
         Calculate sales boost multiplier for a specific date.
@@ -130,18 +183,19 @@ class SalesSimulator:
                 UNDER_SELECTIVE,
                 current_date=current_date
             )
-            outside = self.inventory.get_available_lots_by_classification(
-                OUTSIDE_INSPECTION,
-                current_date=current_date
-            )
-            available_lots = non_selective + selective + outside
-
-            # Weight towards selective items (70% selective, 30% non-selective)
+            # Weight towards selective items (70% selective, 30% non-selective);
+            # only pool all classes when one of them is empty
             if selective and non_selective:
-                if random.random() < 0.7 and selective:
+                if random.random() < 0.7:
                     available_lots = selective
                 else:
                     available_lots = non_selective
+            else:
+                outside = self.inventory.get_available_lots_by_classification(
+                    OUTSIDE_INSPECTION,
+                    current_date=current_date
+                )
+                available_lots = non_selective + selective + outside
 
         if not available_lots:
             return []  # No lots available
@@ -200,8 +254,8 @@ class SalesSimulator:
         # CRITICAL: If basket has multiple lots of same item_description,
         # each lot gets its OWN line item
         line_items = []
-        subtotal = Decimal("0")
-        vat_total = Decimal("0")
+        subtotal = _ZERO
+        vat_total = _ZERO
 
         for lot, quantity, lot_price in basket:
             line_subtotal = lot_price * quantity
@@ -237,8 +291,8 @@ class SalesSimulator:
             self.inventory.deduct_stock(lot['lot_id'], quantity)
 
         # Round to 2 decimal places
-        subtotal = subtotal.quantize(Decimal('0.01'))
-        vat_total = vat_total.quantize(Decimal('0.01'))
+        subtotal = subtotal.quantize(_CENT)
+        vat_total = vat_total.quantize(_CENT)
         total = subtotal + vat_total
 
         # Create invoice
@@ -283,16 +337,16 @@ class SalesSimulator:
         boost = self.calculate_boost_factor(target_date)
         
         # Base number of invoices per day (5-20)
-        base_invoices = random.randint(5, 20)
+        base_invoices = randint(5, 20)
         num_invoices = int(base_invoices * boost)
         
         invoices = []
         
         for i in range(num_invoices):
             # Random time during working hours
-            hour = random.randint(WORKING_HOURS[0], WORKING_HOURS[1])
-            minute = random.randint(0, 59)
-            invoice_datetime = datetime.combine(target_date, datetime.min.time().replace(hour=hour, minute=minute))
+            hour = randint(WORKING_HOURS[0], WORKING_HOURS[1])
+            minute = randint(0, 59)
+            invoice_datetime = datetime(target_date.year, target_date.month, target_date.day, hour, minute)
             
             # Decide invoice type (if not filtered)
             if invoice_type_filter:
@@ -302,7 +356,7 @@ class SalesSimulator:
                 invoice_type = "SIMPLIFIED" if random.random() < 0.8 else "TAX"
             
             # Select items for basket
-            num_items = random.randint(MIN_ITEMS_PER_INVOICE, MAX_ITEMS_PER_INVOICE)
+            num_items = randint(MIN_ITEMS_PER_INVOICE, MAX_ITEMS_PER_INVOICE)
             basket = self.select_items_for_basket(invoice_type, num_items, adjustment_factor, target_date)
             
             if not basket:
@@ -14,6 +14,9 @@ from datetime import datetime, date, timedelta
 from decimal import Decimal
 from typing import List, Dict, Tuple
 from hijri_converter import Hijri, Gregorian
+from rand_utils import randint, weighted_cdf, weighted_index
+
+_CENT = Decimal("0.01")
 
 
 class SmartSalesGenerator:
@@ -32,11 +35,21 @@ class SmartSalesGenerator:
         """
         self.inventory = inventory
         self.holidays = holidays
-        random.seed(random_seed)
-        np.random.seed(random_seed)
+
+        # Own generators, so the draws neither depend on nor reseed the
+        # global `random` / np.random state other code may be using
+        self.rng = random.Random(random_seed)
+        self.np_rng = np.random.RandomState(random_seed)
         
-        # Cache product weights
+        # Cache product weights: {month: {lot_id: weight}}
         self.product_weights_cache = {}
+
+        # Cache normalized date distributions per (dates, quarter) - the date
+        # list is fixed for a quarter, so weights only need computing once
+        self.date_probabilities_cache = {}
+
+        # Cache hour-of-day distributions (hours, CDF) per Friday / other day
+        self.hour_distribution_cache = {}
     
     def calculate_date_weight(
         self,
@@ -135,11 +148,56 @@ class SmartSalesGenerator:
         Returns:
             Invoice size (ex-VAT)
         """
+        return Decimal(str(self._invoice_size(target_date, float(remaining_target), days_remaining, quarter_end)))
+
+    def calculate_invoice_size_cents(
+        self,
+        target_date: date,
+        remaining_cents: int,
+        days_remaining: int,
+        quarter_start: date,
+        quarter_end: date
+    ) -> int:
+        """
+        Same draw as calculate_invoice_size(), in integer cents (for callers
+        that track totals in cents - no Decimal round trip).
+
+        Args:
+            target_date: Date of invoice
+            remaining_cents: Remaining sales target (ex-VAT) in cents
+            days_remaining: Working days remaining
+            quarter_start: Start of quarter
+            quarter_end: End of quarter
+
+        Returns:
+            Invoice size (ex-VAT) in cents
+        """
+        return round(self._invoice_size(target_date, remaining_cents / 100, days_remaining, quarter_end) * 100)
+
+    def _invoice_size(
+        self,
+        target_date: date,
+        remaining_target: float,
+        days_remaining: int,
+        quarter_end: date
+    ) -> float:
+        """
+        Draw an invoice size for calculate_invoice_size*().
+
+        Args:
+            target_date: Date of invoice
+            remaining_target: Remaining sales target (ex-VAT)
+            days_remaining: Working days remaining
+            quarter_end: End of quarter
+
+        Returns:
+            Invoice size (ex-VAT), rounded to 2 decimals
+        """
         if days_remaining <= 0:
             days_remaining = 1
         
         # Base: Average daily target
-        avg_daily = float(remaining_target) / days_remaining
+        avg_daily = remaining_target / days_remaining
         
         # Adjust by day type
         multiplier = 1.0
@@ -172,15 +230,15 @@ class SmartSalesGenerator:
         std_dev = mean * 0.3  # 30% standard deviation
         
         # Generate size from normal distribution
-        size = np.random.normal(mean, std_dev)
+        size = self.np_rng.normal(mean, std_dev)
         
         # Clamp to reasonable range
         min_size = 500.0
-        max_size = min(float(remaining_target), 10000.0)
+        max_size = min(remaining_target, 10000.0)
         
         clamped_size = max(min_size, min(size, max_size))
         
-        return Decimal(str(round(clamped_size, 2)))
+        return round(clamped_size, 2)
     
     def calculate_product_weight(
         self,
@@ -279,16 +337,22 @@ class SmartSalesGenerator:
             return []
         
         # Calculate weights for all products
-        weights = []
-        for product in available_products:
-            # Use cache if available
-            cache_key = (product['lot_id'], target_date.month)
-            if cache_key in self.product_weights_cache:
-                weight = self.product_weights_cache[cache_key]
-            else:
-                weight = self.calculate_product_weight(product, target_date)
-                self.product_weights_cache[cache_key] = weight
-            weights.append(weight)
+        month_weights = self.product_weights_cache.get(target_date.month)
+        if month_weights is None:
+            month_weights = self.product_weights_cache[target_date.month] = {}
+        
+        try:
+            # Usual case: every lot's weight for this month is already cached
+            weights = [month_weights[product['lot_id']] for product in available_products]
+        except KeyError:
+            weights = []
+            for product in available_products:
+                lot_id = product['lot_id']
+                weight = month_weights.get(lot_id)
+                if weight is None:
+                    weight = self.calculate_product_weight(product, target_date)
+                    month_weights[lot_id] = weight
+                weights.append(weight)
         
         # Normalize weights
         total_weight = sum(weights)
@@ -297,11 +361,15 @@ class SmartSalesGenerator:
             weights = [1.0] * len(available_products)
             total_weight = len(available_products)
         
-        probabilities = [w / total_weight for w in weights]
+        probabilities = np.array(weights, dtype=np.float64) / total_weight
         
-        # Select items (without replacement)
+        # Select items (without replacement). A single draw cannot repeat, so
+        # take it straight from the CDF - same index as choice().
         num_to_select = min(num_items, len(available_products))
-        selected_indices = np.random.choice(
+        if num_to_select == 1:
+            return [available_products[weighted_index(weighted_cdf(probabilities), self.np_rng)]]
+        
+        selected_indices = self.np_rng.choice(
             len(available_products),
             size=num_to_select,
             replace=False,
@@ -345,7 +413,7 @@ class SmartSalesGenerator:
         # Distribute target proportionally
         daily_targets = {}
         for day, probability in date_probabilities.items():
-            daily_targets[day] = (total_target * Decimal(str(probability))).quantize(Decimal('0.01'))
+            daily_targets[day] = (total_target * Decimal(str(probability))).quantize(_CENT)
         
         return daily_targets
     
@@ -369,22 +437,31 @@ class SmartSalesGenerator:
         if not available_dates:
             return None
         
-        # Calculate weights
-        weights = [
-            self.calculate_date_weight(d, quarter_start, quarter_end)
-            for d in available_dates
-        ]
-        
-        # Normalize
-        total_weight = sum(weights)
-        if total_weight == 0:
-            return random.choice(available_dates)
-        
-        probabilities = [w / total_weight for w in weights]
-        
-        # Select
-        selected_date = np.random.choice(available_dates, p=probabilities)
-        return selected_date
+        cache_key = (tuple(available_dates), quarter_start, quarter_end)
+        if cache_key not in self.date_probabilities_cache:
+            # Calculate weights
+            weights = [
+                self.calculate_date_weight(d, quarter_start, quarter_end)
+                for d in available_dates
+            ]
+            
+            # Normalize
+            total_weight = sum(weights)
+            if total_weight == 0:
+                self.date_probabilities_cache[cache_key] = None
+            else:
+                self.date_probabilities_cache[cache_key] = (
+                    list(available_dates),
+                    weighted_cdf(np.array([w / total_weight for w in weights]))
+                )
+        
+        cached = self.date_probabilities_cache[cache_key]
+        if cached is None:
+            return self.rng.choice(available_dates)
+        
+        # Select (same draw as choice() over the cached probabilities)
+        dates, cdf = cached
+        return dates[weighted_index(cdf, self.np_rng)]
     
     def calculate_realistic_time(self, target_date: date) -> datetime:
         """
@@ -396,44 +473,48 @@ class SmartSalesGenerator:
         Returns:
             Datetime with realistic hour/minute
         """
-        # Define hourly weights (9 AM to 10 PM)
-        hour_weights = {
-            9: 0.3,   # Slow morning
-            10: 0.5,
-            11: 0.8,
-            12: 1.2,  # Lunch rush
-            13: 1.5,  # Peak
-            14: 1.0,
-            15: 0.8,
-            16: 0.9,
-            17: 1.3,  # Evening rush
-            18: 1.8,  # Peak evening
-            19: 1.5,
-            20: 1.0,
-            21: 0.6,  # Closing
-        }
-        
-        # Adjust for Friday (half day)
-        if target_date.weekday() == 4:
-            # Shift weight to morning, reduce afternoon
-            for hour in range(15, 22):
-                hour_weights[hour] *= 0.2
-            for hour in range(9, 13):
-                hour_weights[hour] *= 1.5
-        
-        # Weighted random selection
-        hours = list(hour_weights.keys())
-        weights = list(hour_weights.values())
-        total_weight = sum(weights)
-        probabilities = [w / total_weight for w in weights]
-        
-        hour = np.random.choice(hours, p=probabilities)
-        minute = random.randint(0, 59)
-        
-        return datetime.combine(
-            target_date,
-            datetime.min.time().replace(hour=hour, minute=minute)
-        )
+        is_friday = target_date.weekday() == 4
+        cached = self.hour_distribution_cache.get(is_friday)
+        
+        if cached is None:
+            # Define hourly weights (9 AM to 10 PM)
+            hour_weights = {
+                9: 0.3,   # Slow morning
+                10: 0.5,
+                11: 0.8,
+                12: 1.2,  # Lunch rush
+                13: 1.5,  # Peak
+                14: 1.0,
+                15: 0.8,
+                16: 0.9,
+                17: 1.3,  # Evening rush
+                18: 1.8,  # Peak evening
+                19: 1.5,
+                20: 1.0,
+                21: 0.6,  # Closing
+            }
+            
+            # Adjust for Friday (half day)
+            if is_friday:
+                # Shift weight to morning, reduce afternoon
+                for hour in range(15, 22):
+                    hour_weights[hour] *= 0.2
+                for hour in range(9, 13):
+                    hour_weights[hour] *= 1.5
+            
+            hours = list(hour_weights.keys())
+            weights = list(hour_weights.values())
+            total_weight = sum(weights)
+            probabilities = np.array([w / total_weight for w in weights])
+            cached = (hours, weighted_cdf(probabilities))
+            self.hour_distribution_cache[is_friday] = cached
+        
+        # Weighted random selection (same draw as choice())
+        hours, cdf = cached
+        hour = hours[weighted_index(cdf, self.np_rng)]
+        minute = randint(0, 59, self.rng)
+        
+        return datetime(target_date.year, target_date.month, target_date.day, hour, minute)
 
 
 # Utility function for integration
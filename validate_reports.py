@@ -51,6 +51,18 @@ class ReportValidator:
         # Also create a normalized version for fuzzy matching
         self.products_df['lot_id_normalized'] = self.products_df['lot_id'].str.lower().str.replace(' ', '')
         
+        # Lookups for the cross-check, built once: first product row per lot_id
+        # and per (customs_no, item) pair (same row a DataFrame filter's .iloc[0] gives)
+        self.products_by_lot_id = {}
+        self.products_by_customs_item = {}
+        for _, product in self.products_df.iterrows():
+            self.products_by_lot_id.setdefault(product['lot_id'], product)
+            customs_item = (
+                str(product['customs_declaration_no']).strip(),
+                str(product['item_description']).strip()
+            )
+            self.products_by_customs_item.setdefault(customs_item, product)
+        
         print(f"  ✓ Products: {len(self.products_df)} lots")
         
         # Load customers
@@ -161,21 +173,16 @@ class ReportValidator:
             price = row['سعر الوحدة (قبل الضريبة)']
             
             # Find in products (try exact match first)
-            product_match = self.products_df[self.products_df['lot_id'] == lot_id]
+            product = self.products_by_lot_id.get(lot_id)
             
             # If not found, try matching by customs_no and item separately
-            if product_match.empty:
-                product_match = self.products_df[
-                    (self.products_df['customs_declaration_no'].astype(str).str.strip() == customs_no) &
-                    (self.products_df['item_description'].astype(str).str.strip() == item_name)
-                ]
+            if product is None:
+                product = self.products_by_customs_item.get((customs_no, item_name))
             
-            if product_match.empty:
+            if product is None:
                 # Only report as mismatch if we can't find it by components either
                 mismatches.append(f"Row {idx}: Lot ID '{lot_id}' not found in products.xlsx")
             else:
-                product = product_match.iloc[0]
-                
                 # Check customs number
                 if str(product['customs_declaration_no']) != str(customs_no):
                     customs_errors.append(